@@ -1,11 +1,10 @@
 import logging
 import urllib.parse
-import requests
-import mimetypes
 
 from pycliarr.api import SonarrCli, SonarrSerieItem
 from Sonarr import tasks, utils
 from YtManagerApp.IProvider import IProvider
+from YtManagerApp.management import thumbnails
 from django.conf import settings
 from YtManagerApp.models import Video, Subscription
 from typing import List, Callable
@@ -51,11 +50,7 @@ class Jobs(IProvider):
         subscription.channel_id = series.id
         subscription.channel_name = series.network
 
-        response = requests.get(series.images[0]['remoteUrl'], stream=True)
-        ext = mimetypes.guess_extension(response.headers['Content-Type'])
-        file_name = f"{series.id}{ext}"
-
-        subscription.thumb.save(file_name, response.raw)
+        thumbnails.fetch_thumbnail(subscription.thumb, series.images[0]['remoteUrl'])
 
         subscription.save()
 0
\ No newline at end of file
@@ -6,6 +6,7 @@ from celery import shared_task
 
 from pycliarr.api import SonarrCli
 from Sonarr import utils
+from YtManagerApp.management import sync_scheduler, result_cache
 
 from YtManagerApp.models import *
 from YtManagerApp.models import Video, Subscription
@@ -19,12 +20,20 @@ __lock = Lock()
 
 @shared_task
 def synchronize_channel(channel_id: int):
+    try:
+        __synchronize_channel(channel_id)
+    finally:
+        sync_scheduler.finish(channel_id)
+
+
+def __synchronize_channel(channel_id: int):
     channel: Subscription = Subscription.objects.get(id=channel_id, provider="Sonarr")
     __log.info("Starting synchronize " + channel.name)
     videos = Video.objects.filter(subscription=channel)
 
     # Remove the 'new' flag
-    videos.update(new=False)
+    if videos.filter(new=True).update(new=False) > 0:
+        result_cache.invalidate(channel.user_id)
 
     episodes: List[dict] = __api.get_episode(channel.channel_id)
 
@@ -1,7 +1,13 @@
+import functools
+
 from django.conf import settings
 
 from pycliarr.api import SonarrCli
 
 
+@functools.lru_cache(maxsize=1)
 def get_api() -> SonarrCli:
+    """
+    Gets the Sonarr client of the current process, which keeps its connections open between requests.
+    """
     return SonarrCli(settings.SONARR_URL, settings.SONARR_API_KEY)
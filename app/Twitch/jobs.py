@@ -1,12 +1,9 @@
 import logging
-import mimetypes
 
 from YtManagerApp.IProvider import IProvider
+from YtManagerApp.management import thumbnails
 from YtManagerApp.models import Video, Subscription
-from Twitch import tasks
-import requests
-import twitch
-from django.conf import settings
+from Twitch import tasks, utils
 
 
 class Jobs(IProvider):
@@ -30,9 +27,7 @@ class Jobs(IProvider):
     def process_url(url: str, subscription: Subscription):
         channel_name = url.split("/")[3]
 
-        helix = twitch.Helix(settings.TWITCH_CLIENT_ID, settings.TWITCH_CLIENT_SECRET)
-
-        channel_info = helix.user(channel_name)
+        channel_info = utils.get_api().user(channel_name)
 
         # No point in storing info about the 'uploads from X' playlist
         subscription.name = channel_info.display_name
@@ -41,9 +36,6 @@ class Jobs(IProvider):
         subscription.channel_id = channel_info.id
         subscription.channel_name = channel_info.login
 
-        response = requests.get(channel_info.profile_image_url, stream=True)
-        ext = mimetypes.guess_extension(response.headers['Content-Type'])
-        file_name = f"{channel_info.id}{ext}"
-        subscription.thumb.save(file_name, response.raw)
+        thumbnails.fetch_thumbnail(subscription.thumb, channel_info.profile_image_url)
 
         subscription.save()
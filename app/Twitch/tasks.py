@@ -1,36 +1,40 @@
 from threading import Lock
 
-import requests
-import twitch
 from celery import shared_task
 
+from Twitch import utils
+from YtManagerApp.management import thumbnails, sync_scheduler, result_cache
 from YtManagerApp.models import *
 from YtManagerApp.models import Video, Subscription
 
 __log = logging.getLogger(__name__)
 _ENABLE_UPDATE_STATS = False
 __lock = Lock()
-__api = twitch.Helix(settings.TWITCH_CLIENT_ID, settings.TWITCH_CLIENT_SECRET)
 
 
 @shared_task
 def synchronize_channel(channel_id: int):
+    try:
+        __synchronize_channel(channel_id)
+    finally:
+        sync_scheduler.finish(channel_id)
+
+
+def __synchronize_channel(channel_id: int):
     channel: Subscription = Subscription.objects.get(id=channel_id, provider="Twitch")
     __log.info("Starting synchronize " + channel.name)
     videos = Video.objects.filter(subscription=channel)
 
     # Remove the 'new' flag
-    videos.update(new=False)
+    if videos.filter(new=True).update(new=False) > 0:
+        result_cache.invalidate(channel.user_id)
 
-    channel_info = __api.user(int(channel.channel_id))
-    response = requests.get(channel_info.profile_image_url, stream=True)
-    ext = mimetypes.guess_extension(response.headers['Content-Type'])
-    file_name = f"{channel_info.id}{ext}"
-    channel.thumb.save(file_name, response.raw)
+    channel_info = utils.get_api().user(int(channel.channel_id))
+    thumbnails.fetch_thumbnail(channel.thumb, channel_info.profile_image_url)
 
     __log.info("Starting check new videos " + channel.name)
 
-    for item in __api.videos(user_id=channel.channel_id):
+    for item in utils.get_api().videos(user_id=channel.channel_id):
         results = Video.objects.filter(video_id=item.id, subscription=channel)
 
         if not results.exists():
@@ -44,17 +48,15 @@ def synchronize_channel(channel_id: int):
             video.subscription = channel
             video.playlist_index = 0
             video.publish_date = item.published_at
-
-            response = requests.get(item.thumbnail_url.replace("%{width}", "1920").replace("%{height}", "1080"), stream=True)
-            ext = mimetypes.guess_extension(response.headers['Content-Type'])
-            file_name = f"{item.id}{ext}"
-            video.thumb.save(file_name, response.raw)
-
             video.save()
 
+            width, height = settings.THUMBNAIL_SIZE_VIDEO
+            thumbnails.fetch_thumbnail(video.thumb,
+                                       item.thumbnail_url.replace("%{width}", str(width)).replace("%{height}", str(height)))
+
             synchronize_video(video)
     channel.last_synchronised = datetime.datetime.now()
-    channel.save()
+    channel.save(update_fields=['last_synchronised'])
 
 #    for video in videos:
 #        synchronize_video(video)
@@ -91,23 +93,23 @@ def actual_synchronize_video(video_id: int):
     video = Video.objects.get(id=video_id, subscription__provider="Twitch")
     __log.info("Starting synchronize video " + video.video_id)
     if video.downloaded_path is not None:
-        try:
-            files = list(video.get_files())
-        except FileNotFoundError:
-            files = []
+        files = video.get_registered_files()
 
-        # Try to find a valid video file
+        # Try to find a valid video file; the registry may still list files deleted since it was last reconciled
         found_video = False
         for file in files:
-            mime, _ = mimetypes.guess_type(file)
-            if mime is not None and mime.startswith("video"):
+            if file.mime.startswith("video") and os.path.isfile(file.path):
                 found_video = True
 
         # Video not found, we can safely assume that the video was deleted.
         if not found_video:
             # Clean up
             for file in files:
-                os.unlink(file)
+                try:
+                    os.unlink(file.path)
+                except FileNotFoundError:
+                    pass
+            video.files.all().delete()
             video.downloaded_path = None
 
             # Mark watched?
@@ -116,7 +118,7 @@ def actual_synchronize_video(video_id: int):
                 video.watched = True
 
     if _ENABLE_UPDATE_STATS or video.duration == 0:
-        video_stats = __api.video(video.video_id)
+        video_stats = utils.get_api().video(video.video_id)
 
         video.views = video_stats.view_count
         video.description = video_stats.description
@@ -185,6 +187,7 @@ def delete_video(video_pk: int):
                     video.name,
                     e)
 
+    video.files.all().delete()
     video.downloaded_path = None
     video.save()
 
@@ -1,12 +1,24 @@
+import functools
 import logging
 from string import Template
 
 import os
+import twitch
 import youtube_dl
+from django.conf import settings
 
 from YtManagerApp.models import Video
 
 
+@functools.lru_cache(maxsize=1)
+def get_api() -> twitch.Helix:
+    """
+    Gets the Helix client of the current process. Building a client requests a new access token, so it is only
+    done once.
+    """
+    return twitch.Helix(settings.TWITCH_CLIENT_ID, settings.TWITCH_CLIENT_SECRET)
+
+
 def build_youtube_dl_params(video: Video):
     sub = video.subscription
     user = sub.user
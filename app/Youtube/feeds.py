@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+from YtManagerApp.models import Subscription, FeedCache
+
+RSS_URL = "https://www.youtube.com/feeds/videos.xml?channel_id="
+
+# Maximum number of feed requests in flight at any time
+MAX_CONCURRENCY = 50
+# Maximum number of requests in flight, and started per second, for a single host
+MAX_CONCURRENCY_PER_HOST = 25
+MAX_REQUESTS_PER_SECOND_PER_HOST = 100
+REQUEST_TIMEOUT = 30
+
+log = logging.getLogger(__name__)
+
+
+class _HostLimiter(object):
+    """
+    Limits the number of concurrent requests, and the rate at which requests are started, for a single host.
+    """
+
+    def __init__(self, concurrency: int, requests_per_second: float):
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__lock = asyncio.Lock()
+        self.__interval = 1.0 / requests_per_second
+        self.__next_slot = 0.0
+
+    async def __aenter__(self):
+        await self.__semaphore.acquire()
+        async with self.__lock:
+            now = time.monotonic()
+            delay = self.__next_slot - now
+            self.__next_slot = max(now, self.__next_slot) + self.__interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__semaphore.release()
+
+
+def feed_url(subscription: Subscription) -> str:
+    return RSS_URL + subscription.channel_id
+
+
+def fetch_feeds(subscriptions: List[Subscription]) -> Dict[int, Union[httpx.Response, Exception]]:
+    """
+    Downloads the RSS feeds of the given subscriptions concurrently. Conditional request headers are taken from
+    each subscription's feed cache, so unchanged feeds are usually answered with 304 Not Modified.
+
+    This must not be called from within a running event loop.
+    :param subscriptions: Subscriptions, with their feed cache already loaded
+    :return: Dictionary mapping each subscription ID to its response, or to the exception raised while fetching it
+    """
+    feed_requests = {sub.id: (feed_url(sub), __request_headers(sub)) for sub in subscriptions}
+    start = time.monotonic()
+    results = asyncio.run(__fetch_all(feed_requests))
+    log.info('Fetched %d feeds in %.1f seconds', len(results), time.monotonic() - start)
+    return results
+
+
+def __request_headers(subscription: Subscription) -> dict:
+    try:
+        return subscription.feed_cache.request_headers()
+    except FeedCache.DoesNotExist:
+        return {}
+
+
+async def __fetch_all(feed_requests: Dict[int, tuple]) -> Dict[int, Union[httpx.Response, Exception]]:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    host_limiters: Dict[str, _HostLimiter] = {}
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+
+    async def fetch(client: httpx.AsyncClient, url: str, headers: dict):
+        host = urlsplit(url).netloc
+        if host not in host_limiters:
+            host_limiters[host] = _HostLimiter(MAX_CONCURRENCY_PER_HOST, MAX_REQUESTS_PER_SECOND_PER_HOST)
+
+        async with semaphore, host_limiters[host]:
+            response = await client.get(url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+
+    async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT, follow_redirects=True) as client:
+        ids = list(feed_requests.keys())
+        responses = await asyncio.gather(*(fetch(client, *feed_requests[sub_id]) for sub_id in ids),
+                                         return_exceptions=True)
+
+    return dict(zip(ids, responses))
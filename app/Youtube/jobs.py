@@ -1,4 +1,6 @@
 import logging
+from typing import List
+
 from external.pytaw.pytaw.youtube import InvalidURL
 
 from Youtube import tasks, youtube, utils
@@ -12,6 +14,10 @@ class Jobs(IProvider):
     def synchronise_channel(subscription: Subscription):
         tasks.synchronize_channel.delay(subscription.pk)
 
+    @staticmethod
+    def synchronise_channels(subscriptions: List[Subscription]):
+        tasks.synchronize_channels.delay([subscription.pk for subscription in subscriptions])
+
     @staticmethod
     def download_video(video: Video):
         tasks.download_video.delay(video.pk)
@@ -1,75 +1,139 @@
-from threading import Lock
+import functools
+import time
 from xml.etree import ElementTree
 
-import requests
-import youtube_dl
 from celery import shared_task
-from django.db.models import Max
+from django.conf import settings
+from django.db.models import Q
 
-from Youtube import youtube, utils
+from Youtube import youtube, utils, feeds
+from YtManagerApp.management import thumbnails, result_cache, sync_scheduler, api_quota, http_client, \
+    download_executor, downloader, file_registry
 from YtManagerApp.models import *
-from YtManagerApp.models import Video, Subscription
+from YtManagerApp.models import Video, Subscription, FeedCache, DownloadState
 from external.pytaw.pytaw.youtube import Video as APIVideo
-from YtManagerApp.utils import first_non_null
-from typing import List
+from external.pytaw.pytaw.utils import iterate_chunks
+from typing import List, Optional
 
 __log = logging.getLogger(__name__)
 _ENABLE_UPDATE_STATS = False
-__api: youtube.YoutubeAPI = youtube.YoutubeAPI.build_public()
-__lock = Lock()
+# The 'videos' endpoint accepts at most 50 IDs per request
+_STATS_BATCH_SIZE = 50
+# Number of subscriptions whose statistics are refreshed by a single task
+_STATS_TASK_SIZE = 100
+# Fields written by the statistics refresh
+_STATS_FIELDS = ['rating', 'views', 'duration', 'description', 'thumbnail']
+_BULK_CREATE_BATCH_SIZE = 500
+# Failed downloads are retried after 1 minute, then 2, 4... up to half the broker's visibility timeout (6 hours),
+# since Redis delivers waiting tasks again to another worker once it expires
+_DOWNLOAD_RETRY_DELAY = 60
+_DOWNLOAD_MAX_RETRY_DELAY = settings.CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout'] // 2
+# Downloads which find all the download slots taken are queued again after this many seconds
+_DOWNLOAD_SLOT_WAIT = 60
 
 
 @shared_task
 def synchronize_channel(channel_id: int):
     channel: Subscription = Subscription.objects.get(id=channel_id, provider="Youtube")
+    try:
+        __synchronize_channel(channel)
+    finally:
+        sync_scheduler.finish(channel.id)
+
+    queue_video_stats([channel.id])
+    downloader.process_user(channel.user)
+
+
+@shared_task
+def synchronize_channels(channel_ids: List[int]):
+    """
+    Synchronizes several subscriptions at once. The RSS feeds are downloaded concurrently first, and only the feeds
+    which have changed are parsed and written to the database.
+    :param channel_ids: Subscription IDs
+    """
+    refreshed_at = time.monotonic()
+    try:
+        channels = list(Subscription.objects
+                        .filter(id__in=channel_ids, provider="Youtube")
+                        .select_related('feed_cache', 'user'))
+        __log.info("Starting synchronize %d channels", len(channels))
+
+        feeds_to_fetch = [channel for channel in channels if channel.last_synchronised is not None]
+        rss_responses = feeds.fetch_feeds(feeds_to_fetch)
+    except Exception:
+        # None of the channels will be finished, so their locks are released now
+        sync_scheduler.release(channel_ids)
+        raise
+
+    for i, channel in enumerate(channels):
+        if time.monotonic() - refreshed_at > sync_scheduler.SYNC_LOCK_REFRESH:
+            sync_scheduler.refresh(remaining.id for remaining in channels[i:])
+            refreshed_at = time.monotonic()
+
+        try:
+            __synchronize_channel(channel, rss_responses.get(channel.id))
+        except api_quota.QuotaExceeded as e:
+            __log.warning("Synchronization of %s postponed: %s", channel.name, e)
+        except Exception as e:
+            __log.exception("Error while synchronizing %s: %s", channel.name, e)
+        finally:
+            sync_scheduler.finish(channel.id)
+
+    http_client.log_stats()
+    queue_video_stats([channel.id for channel in channels])
+
+    # New videos may be downloaded now, planned once per user across all of their subscriptions
+    downloader.process_users({channel.user for channel in channels})
+
+
+def __synchronize_channel(channel: Subscription, rss_response=None):
+    with api_quota.charge_to(channel.id, api_quota.PRIORITY_DISCOVERY):
+        __synchronize_channel_videos(channel, rss_response)
+
+
+def __synchronize_channel_videos(channel: Subscription, rss_response=None):
     __log.info("Starting synchronize " + channel.name)
     videos = Video.objects.filter(subscription=channel)
 
     # Remove the 'new' flag
-    videos.update(new=False)
-
-    for video in videos:
-        synchronize_video(video)
+    if videos.filter(new=True).update(new=False) > 0:
+        result_cache.invalidate(channel.user_id)
+
+    # Only the downloaded videos can change on disk, and only those without a video file in the file registry (kept
+    # in line with the disk by reconcile_video_files) are checked; metadata is refreshed for the videos marked as
+    # needing a sync
+    for video_id in videos \
+            .filter(downloaded_path__isnull=False) \
+            .exclude(files__mime__startswith='video') \
+            .values_list('id', flat=True):
+        actual_synchronize_video.delay(video_id)
 
     __log.info("Starting check new videos " + channel.name)
     if channel.last_synchronised is None:
         check_all_videos(channel)
     else:
         if (datetime.datetime.now(datetime.timezone.utc) - channel.last_synchronised) > datetime.timedelta(days=1):
-            utils.load_resource_thumbnail(channel.playlist_id, __api.channel(channel.channel_id), channel.thumb, __log)
+            __refresh_channel_thumbnail(channel)
         try:
-            check_rss_videos(channel)
+            if isinstance(rss_response, Exception):
+                raise rss_response
+            check_rss_videos(channel, rss_response)
+        except api_quota.QuotaExceeded:
+            raise
         except Exception as e:
             __log.exception("Error while running RSS Sync, running full sync", e)
             check_all_videos(channel)
     channel.last_synchronised = datetime.datetime.now(datetime.timezone.utc)
-    channel.save()
-
-    enabled = first_non_null(channel.auto_download, channel.user.preferences['auto_download'])
+    channel.save(update_fields=['last_synchronised'])
 
-    if enabled:
-        global_limit = channel.user.preferences['download_global_limit']
-        limit = first_non_null(channel.download_limit, channel.user.preferences['download_subscription_limit'])
-        order = first_non_null(channel.download_order, channel.user.preferences['download_order'])
-        order = VIDEO_ORDER_MAPPING[order]
 
-        videos_to_download = Video.objects \
-            .filter(subscription=channel, downloaded_path__isnull=True, watched=False, subscription__auto_download=True) \
-            .order_by(order)
-
-        if global_limit > 0:
-            global_downloaded = Video.objects.filter(subscription__user=channel.user, downloaded_path__isnull=False).count()
-            allowed_count = max(global_limit - global_downloaded, 0)
-            videos_to_download = videos_to_download[0:allowed_count]
-
-        if limit > 0:
-            sub_downloaded = Video.objects.filter(subscription=channel, downloaded_path__isnull=False).count()
-            allowed_count = max(limit - sub_downloaded, 0)
-            videos_to_download = videos_to_download[0:allowed_count]
-
-        # enqueue download
-        for video in videos_to_download:
-            download_video.delay(video.pk)
+def __refresh_channel_thumbnail(channel: Subscription):
+    with api_quota.charge_to(channel.id, api_quota.PRIORITY_STATS):
+        try:
+            api = youtube.YoutubeAPI.build_public()
+            utils.load_resource_thumbnail(api.channel(channel.channel_id), channel.thumb)
+        except api_quota.QuotaExceeded as e:
+            __log.info("Channel thumbnail refresh postponed for %s: %s", channel.name, e)
 
 
 @shared_task
@@ -77,23 +141,23 @@ def actual_synchronize_video(video_id: int):
     video = Video.objects.get(id=video_id, subscription__provider="Youtube")
     __log.info("Starting synchronize video " + video.video_id)
     if video.downloaded_path is not None:
-        try:
-            files = list(video.get_files())
-        except FileNotFoundError:
-            files = []
+        files = video.get_registered_files()
 
-        # Try to find a valid video file
+        # Try to find a valid video file; the registry may still list files deleted since it was last reconciled
         found_video = False
         for file in files:
-            mime, _ = mimetypes.guess_type(file)
-            if mime is not None and mime.startswith("video"):
+            if file.mime.startswith("video") and os.path.isfile(file.path):
                 found_video = True
 
         # Video not found, we can safely assume that the video was deleted.
         if not found_video:
             # Clean up
             for file in files:
-                os.unlink(file)
+                try:
+                    os.unlink(file.path)
+                except FileNotFoundError:
+                    pass
+            video.files.all().delete()
             video.downloaded_path = None
 
             # Mark watched?
@@ -101,55 +165,182 @@ def actual_synchronize_video(video_id: int):
             if user.preferences['mark_deleted_as_watched']:
                 video.watched = True
 
-    if _ENABLE_UPDATE_STATS or video.duration == 0:
-        video_stats = __api.video(video.video_id, part='id,statistics,contentDetails')
+            video.save()
 
-        if video_stats is None:
-            return
 
-        if video_stats.n_likes + video_stats.n_dislikes > 0:
-            video.rating = video_stats.n_likes / (video_stats.n_likes + video_stats.n_dislikes)
+def queue_video_stats(channel_ids: List[int]):
+    """
+    Queues the statistics refresh of the subscriptions which have videos needing it, _STATS_TASK_SIZE subscriptions
+    per task. Subscriptions with nothing to refresh don't cost a task.
+    :param channel_ids: Subscription IDs
+    """
+    videos = Video.objects.filter(subscription_id__in=channel_ids)
+    if not _ENABLE_UPDATE_STATS:
+        videos = videos.filter(needs_sync=True)
+    due_ids = sorted(set(videos.values_list('subscription_id', flat=True)))
+
+    for chunk in iterate_chunks(due_ids, _STATS_TASK_SIZE):
+        synchronize_video_stats.delay(list(chunk))
+
+
+@shared_task
+def synchronize_video_stats(channel_ids: List[int]):
+    """
+    Refreshes the statistics (views, rating, duration, description) of every video which needs them in several
+    subscriptions, querying the API for up to 50 videos at a time (from any of the subscriptions) and writing each
+    batch back with a single query. When the API quota runs low, the remaining videos are left for a later
+    synchronization. Afterwards, the missing thumbnails are downloaded.
+    :param channel_ids: Subscription IDs
+    """
+    videos = Video.objects.filter(subscription_id__in=channel_ids, subscription__provider="Youtube")
+    if not _ENABLE_UPDATE_STATS:
+        videos = videos.filter(needs_sync=True)
+    videos = list(videos.order_by('subscription_id').only('id', 'video_id', 'subscription_id', *_STATS_FIELDS))
+
+    __log.info("Starting synchronize stats for %d videos of %d subscriptions", len(videos), len(channel_ids))
+
+    changed_channel_ids = set()
+    try:
+        for chunk in iterate_chunks(videos, _STATS_BATCH_SIZE):
+            # A request covers several subscriptions; it is charged to the one of the first video
+            with api_quota.charge_to(chunk[0].subscription_id, api_quota.PRIORITY_STATS):
+                changed_channel_ids.update(video.subscription_id for video in __synchronize_video_stats_chunk(chunk))
+    except api_quota.QuotaExceeded as e:
+        __log.info("Synchronize stats postponed: %s", e)
+
+    for user_id in Subscription.objects.filter(id__in=changed_channel_ids).values_list('user_id', flat=True).distinct():
+        result_cache.invalidate(user_id)
+    load_video_thumbnails.delay(channel_ids)
+
+
+@shared_task
+def load_video_thumbnails(channel_ids: List[int]):
+    """
+    Downloads the thumbnails of the videos in several subscriptions which don't have one yet. The thumbnail URL is
+    recorded when the video is discovered, so that the synchronization doesn't have to wait for the image downloads.
+    :param channel_ids: Subscription IDs
+    """
+    videos = Video.objects.filter(Q(thumb='') | Q(thumb__isnull=True),
+                                  subscription_id__in=channel_ids,
+                                  subscription__provider="Youtube",
+                                  thumbnail__startswith='http') \
+        .select_related('subscription')
+
+    for video in videos:
+        thumbnails.fetch_thumbnail(video.thumb, video.thumbnail)
 
-        video.views = video_stats.n_views
-        video.duration = video_stats.duration.total_seconds()
-        video.description = video_stats.description
-        video.save()
+
+def __synchronize_video_stats_chunk(chunk: List[Video]) -> List[Video]:
+    api = youtube.YoutubeAPI.build_public()
+    videos_by_id = {video.video_id: video for video in chunk}
+    updated_videos = []
+
+    for video_stats in api.videos(videos_by_id.keys(), part='id,snippet,statistics,contentDetails'):
+        video = videos_by_id.get(video_stats.id)
+        if video is None:
+            continue
+
+        before = [getattr(video, field) for field in _STATS_FIELDS]
+        __update_video_stats(video, video_stats)
+        if [getattr(video, field) for field in _STATS_FIELDS] != before:
+            updated_videos.append(video)
+
+    Video.objects.bulk_update(updated_videos, _STATS_FIELDS)
+
+    # Videos which the API doesn't return any more (deleted or private) will never become complete
+    Video.objects.filter(id__in=[video.id for video in chunk]).update(needs_sync=False)
+    return updated_videos
+
+
+def __update_video_stats(video: Video, video_stats: APIVideo):
+    if video_stats.n_likes + video_stats.n_dislikes > 0:
+        video.rating = video_stats.n_likes / (video_stats.n_likes + video_stats.n_dislikes)
+
+    video.views = video_stats.n_views
+    video.duration = video_stats.duration.total_seconds()
+    video.description = video_stats.description
+
+    if not video.thumbnail:
+        thumbnail = utils.best_thumbnail(video_stats)
+        if thumbnail is not None:
+            video.thumbnail = thumbnail.url
 
 
 @shared_task()
 def download_video(video_pk: int, attempt: int = 1):
-    # Issue: if multiple videos are downloaded at the same time, a race condition appears in the mkdirs() call that
-    # youtube-dl makes, which causes it to fail with the error 'Cannot create folder - file already exists'.
-    # For now, allow a single download instance.
-    video = Video.objects.get(pk=video_pk, subscription__provider="Youtube")
-    __lock.acquire()
+    """
+    Downloads a video through the worker's download pool, once one of the download slots shared by all the workers
+    is free. Partial files left by an earlier attempt are continued. While the slots are all taken, the task is
+    queued again for later instead of holding the worker.
+    :param video_pk: Video ID
+    :param attempt: Download attempt
+    """
+    video = Video.objects.select_related('subscription').get(pk=video_pk, subscription__provider="Youtube")
+    url = "https://www.youtube.com/watch?v=" + video.video_id
+
+    # Only marked as downloading once the pool starts it, so that waiting downloads don't look interrupted
+    state = DownloadState.queue(video)
+
+    slot = download_executor.acquire_slot(url)
+    if slot is None:
+        __log.info('No free download slot for video %d [%s], waiting %d seconds', video.id, video.video_id,
+                   _DOWNLOAD_SLOT_WAIT)
+        download_video.apply_async((video_pk, attempt), countdown=_DOWNLOAD_SLOT_WAIT)
+        return
 
     try:
-        user = video.subscription.user
-        max_attempts = user.preferences['max_download_attempts']
-
         youtube_dl_params, output_path = utils.build_youtube_dl_params(video)
-        with youtube_dl.YoutubeDL(youtube_dl_params) as yt:
-            ret = yt.download(["https://www.youtube.com/watch?v=" + video.video_id])
+        youtube_dl_params['progress_hooks'] = [state.record_progress]
+        future = download_executor.submit(url, youtube_dl_params, slot,
+                                          on_start=functools.partial(__start_download, video, state),
+                                          heartbeat=state.heartbeat)
+        try:
+            ret, error = future.result().return_code, ''
+        except Exception as e:
+            __log.exception('Error while downloading video %d [%s %s]: %s', video.id, video.video_id, video.name, e)
+            ret, error = None, str(e)
+    finally:
+        download_executor.release_slot(slot)
 
-        __log.info('Download finished with code %d', ret)
+    __finish_download(video, state, output_path, ret, error, attempt)
+    download_executor.log_stats()
 
-        if ret == 0:
-            video.downloaded_path = output_path
-            video.save()
-            __log.info('Video %d [%s %s] downloaded successfully!', video.id, video.video_id, video.name)
 
-        elif attempt <= max_attempts:
-            __log.warning('Re-enqueueing video (attempt %d/%d)', attempt, max_attempts)
-            download_video.delay(video, attempt + 1)
+def __start_download(video: Video, state: DownloadState):
+    state.start()
+    if state.partial_path:
+        __log.info('Resuming download of video %d [%s] from %d bytes', video.id, video.video_id,
+                   state.downloaded_bytes)
 
-        else:
-            __log.error('Multiple attempts to download video %d [%s %s] failed!', video.id, video.video_id, video.name)
-            video.downloaded_path = ''
-            video.save()
 
-    finally:
-        __lock.release()
+def __finish_download(video: Video, state: DownloadState, output_path: str, ret: Optional[int], error: str,
+                      attempt: int):
+    user = video.subscription.user
+    max_attempts = user.preferences['max_download_attempts']
+
+    __log.info('Download finished with code %s', ret)
+
+    if ret == 0:
+        # Saved before the files are registered, so that the registry never lists files of a video which isn't
+        # downloaded (see file_registry.reconcile)
+        video.downloaded_path = output_path
+        video.save()
+        video.downloaded_size = sum(file.size for file in file_registry.register(video))
+        video.save()
+        state.finish('completed')
+        __log.info('Video %d [%s %s] downloaded successfully!', video.id, video.video_id, video.name)
+
+    elif attempt <= max_attempts:
+        delay = min(_DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1), _DOWNLOAD_MAX_RETRY_DELAY)
+        __log.warning('Re-enqueueing video in %d seconds (attempt %d/%d)', delay, attempt, max_attempts)
+        state.finish('retrying', error or f'youtube-dl exited with code {ret}')
+        download_video.apply_async((video.pk, attempt + 1), countdown=delay)
+
+    else:
+        __log.error('Multiple attempts to download video %d [%s %s] failed!', video.id, video.video_id, video.name)
+        video.downloaded_path = ''
+        video.save()
+        state.finish('failed', error or f'youtube-dl exited with code {ret}')
 
 
 @shared_task()
@@ -173,6 +364,7 @@ def delete_video(video_pk: int):
                     video.name,
                     e)
 
+    video.files.all().delete()
     video.downloaded_path = None
     video.save()
 
@@ -184,94 +376,116 @@ def delete_video(video_pk: int):
 
 
 def synchronize_video(video: Video):
-    if video.downloaded_path is not None or _ENABLE_UPDATE_STATS or video.duration == 0:
+    # Statistics and thumbnails are refreshed in batches by synchronize_video_stats
+    if video.downloaded_path is not None:
         actual_synchronize_video.delay(video.id)
 
-    if not video.thumb:
-        utils.load_resource_thumbnail(video.video_id, __api.video(video.video_id), video.thumb, __log)
 
+def check_rss_videos(sub: Subscription, rss_request=None):
+    """
+    Looks for new videos in the RSS feed of a subscription.
+    :param sub: Subscription
+    :param rss_request: Feed response which was already downloaded; if None, the feed is downloaded here
+    """
+    feed_cache, _ = FeedCache.objects.get_or_create(subscription=sub)
 
-def check_rss_videos(sub: Subscription):
-    found_existing_video = False
+    if rss_request is None:
+        rss_request = http_client.get_session().get(feeds.feed_url(sub), headers=feed_cache.request_headers())
+        rss_request.raise_for_status()
 
-    rss_request = requests.get("https://www.youtube.com/feeds/videos.xml?channel_id=" + sub.channel_id)
-    rss_request.raise_for_status()
+    if not feed_cache.is_modified(rss_request):
+        feed_cache.record_hit()
+        __log.info("RSS feed for %s unchanged (%d hits, %d misses)", sub.name, feed_cache.hits, feed_cache.misses)
+        return
 
     rss = ElementTree.fromstring(rss_request.content)
-    for entry in rss.findall("{http://www.w3.org/2005/Atom}entry"):
-        video_id = entry.find("{http://www.youtube.com/xml/schemas/2015}videoId").text
-        results = Video.objects.filter(video_id=video_id, subscription=sub)
-        if results.exists():
-            found_existing_video = True
-        else:
-            video_title = entry.find("{http://www.w3.org/2005/Atom}title").text
-
-            video = Video()
-            video.video_id = video_id
-            video.name = video_title
-            video.description = entry.find("{http://search.yahoo.com/mrss/}group") \
-                                     .find("{http://search.yahoo.com/mrss/}description").text or ""
-            video.watched = False
-            video.new = True
-            video.downloaded_path = None
-            video.subscription = sub
-            video.playlist_index = 0
-            video.publish_date = datetime.datetime.fromisoformat(entry.find("{http://www.w3.org/2005/Atom}published").text)
-
-            utils.load_url_thumbnail(video_id,
-                                     entry.find("{http://search.yahoo.com/mrss/}group")
-                                          .find("{http://search.yahoo.com/mrss/}thumbnail")
-                                          .get("url"),
-                                     video.thumb,
-                                     __log)
-
-            video.rating = entry \
-                .find("{http://search.yahoo.com/mrss/}group") \
-                .find("{http://search.yahoo.com/mrss/}community") \
-                .find("{http://search.yahoo.com/mrss/}starRating") \
-                .get("average")
-            video.views = entry \
-                .find("{http://search.yahoo.com/mrss/}group") \
-                .find("{http://search.yahoo.com/mrss/}community") \
-                .find("{http://search.yahoo.com/mrss/}statistics") \
-                .get("views")
-            video.save()
-
-            synchronize_video(video)
-
-    if not found_existing_video:
+    entries = {
+        entry.find("{http://www.youtube.com/xml/schemas/2015}videoId").text: entry
+        for entry in rss.findall("{http://www.w3.org/2005/Atom}entry")
+    }
+
+    existing_video_ids = set(Video.objects
+                             .filter(subscription=sub, video_id__in=entries.keys())
+                             .values_list('video_id', flat=True))
+
+    new_videos = []
+    for video_id, entry in entries.items():
+        if video_id in existing_video_ids:
+            continue
+
+        media_group = entry.find("{http://search.yahoo.com/mrss/}group")
+        media_community = media_group.find("{http://search.yahoo.com/mrss/}community")
+
+        video = Video()
+        video.video_id = video_id
+        video.name = entry.find("{http://www.w3.org/2005/Atom}title").text
+        video.description = media_group.find("{http://search.yahoo.com/mrss/}description").text or ""
+        video.watched = False
+        video.new = True
+        video.downloaded_path = None
+        video.subscription = sub
+        video.playlist_index = 0
+        video.publish_date = datetime.datetime.fromisoformat(entry.find("{http://www.w3.org/2005/Atom}published").text)
+        video.thumbnail = media_group.find("{http://search.yahoo.com/mrss/}thumbnail").get("url")
+        video.rating = media_community.find("{http://search.yahoo.com/mrss/}starRating").get("average")
+        video.views = media_community.find("{http://search.yahoo.com/mrss/}statistics").get("views")
+        new_videos.append(video)
+
+    Video.bulk_create_counted(new_videos, batch_size=_BULK_CREATE_BATCH_SIZE)
+
+    if len(existing_video_ids) == 0:
         check_all_videos(sub)
 
+    feed_cache.record_miss(rss_request)
+    __log.info("RSS feed for %s processed (%d hits, %d misses)", sub.name, feed_cache.hits, feed_cache.misses)
+
 
 def check_all_videos(sub: Subscription):
-    playlist_items: List[APIVideo] = __api.playlist_items(sub.playlist_id)
+    api = youtube.YoutubeAPI.build_public()
+    playlist_items: List[APIVideo] = api.playlist_items(sub.playlist_id)
     if sub.rewrite_playlist_indices:
         playlist_items = sorted(playlist_items, key=lambda x: x.published_at)
     else:
         playlist_items = sorted(playlist_items, key=lambda x: x.position)
 
-    for item in playlist_items:
-        results = Video.objects.filter(video_id=item.resource_video_id, subscription=sub)
-
-        if not results.exists():
-            # fix playlist index if necessary
-            if sub.rewrite_playlist_indices or Video.objects.filter(subscription=sub, playlist_index=item.position).exists():
-                highest = Video.objects.filter(subscription=sub).aggregate(Max('playlist_index'))['playlist_index__max']
-                item.position = 1 + (highest or -1)
-
-            video = Video()
-            video.video_id = item.resource_video_id
-            video.name = item.title
-            video.description = item.description
-            video.watched = False
-            video.new = True
-            video.downloaded_path = None
-            video.subscription = sub
-            video.playlist_index = item.position
-            video.publish_date = item.published_at
+    # Load what we already know about the subscription once, and work out the new rows in memory
+    known_video_ids = set()
+    used_indices = set()
+    for video_id, playlist_index in Video.objects.filter(subscription=sub).values_list('video_id', 'playlist_index'):
+        known_video_ids.add(video_id)
+        used_indices.add(playlist_index)
+    highest_index = max(used_indices, default=-1)
 
-            utils.load_resource_thumbnail(item.resource_video_id, item, video.thumb, __log)
-
-            video.save()
-
-            synchronize_video(video)
+    new_videos = []
+    for item in playlist_items:
+        if item.resource_video_id in known_video_ids:
+            continue
+
+        # fix playlist index if necessary
+        position = item.position
+        if sub.rewrite_playlist_indices or position in used_indices:
+            position = highest_index + 1
+
+        known_video_ids.add(item.resource_video_id)
+        used_indices.add(position)
+        highest_index = max(highest_index, position)
+
+        video = Video()
+        video.video_id = item.resource_video_id
+        video.name = item.title
+        video.description = item.description
+        video.watched = False
+        video.new = True
+        video.downloaded_path = None
+        video.subscription = sub
+        video.playlist_index = position
+        video.publish_date = item.published_at
+
+        thumbnail = utils.best_thumbnail(item)
+        if thumbnail is not None:
+            video.thumbnail = thumbnail.url
+
+        new_videos.append(video)
+
+    Video.bulk_create_counted(new_videos, batch_size=_BULK_CREATE_BATCH_SIZE)
+    __log.info("Added %d new videos to %s", len(new_videos), sub.name)
@@ -1,14 +1,13 @@
 import logging
-import mimetypes
 from string import Template
 from typing import Optional, TYPE_CHECKING
 
 import os
 import re
-import requests
 import youtube_dl
 from external.pytaw.pytaw.youtube import Thumbnail, Resource, Channel, Playlist
 
+from YtManagerApp.management import thumbnails
 from YtManagerApp.models import Video, Subscription
 
 if TYPE_CHECKING:
@@ -38,6 +37,11 @@ def build_youtube_dl_params(video: Video):
         'writeautomaticsub': user.preferences['download_autogenerated_subtitles'],
         'allsubtitles': user.preferences['download_subtitles_all'],
         'merge_output_format': 'mp4',
+        # Partial files are kept and continued with HTTP range requests when a download is retried
+        'continuedl': True,
+        'nopart': False,
+        'retries': 10,
+        'fragment_retries': 10,
         'postprocessors': [
             {
                 'key': 'FFmpegMetadata'
@@ -102,7 +106,7 @@ def fill_from_playlist(subscription: Subscription, info_playlist: Playlist, log)
     subscription.channel_id = info_playlist.channel_id
     subscription.channel_name = info_playlist.channel_title
 
-    load_resource_thumbnail(info_playlist.id, info_playlist, subscription.thumb, log)
+    load_resource_thumbnail(info_playlist, subscription.thumb)
 
     subscription.save()
 
@@ -116,21 +120,12 @@ def copy_from_channel(subscription: Subscription, info_channel: Channel, log):
     subscription.channel_name = info_channel.title
     subscription.rewrite_playlist_indices = True
 
-    load_resource_thumbnail(info_channel.id, info_channel, subscription.thumb, log)
+    load_resource_thumbnail(info_channel, subscription.thumb)
 
     subscription.save()
 
 
-def load_resource_thumbnail(item_id: str, url: Resource, field: 'ImageFieldFile', log: logging.Logger):
-    load_url_thumbnail(item_id, best_thumbnail(url).url, field, log)
-
-
-def load_url_thumbnail(item_id: str, url: str, field: 'ImageFieldFile', log: logging.Logger):
-    try:
-        response = requests.get(url, stream=True)
-        ext = mimetypes.guess_extension(response.headers['Content-Type'])
-        file_name = f"{item_id}{ext}"
-
-        field.save(file_name, response.raw)
-    except requests.exceptions.RequestException as e:
-        log.error('Error while downloading stream for thumbnail %s. Error: %s', url, e)
+def load_resource_thumbnail(resource: Resource, field: 'ImageFieldFile'):
+    thumbnail = best_thumbnail(resource)
+    if thumbnail is not None:
+        thumbnails.fetch_thumbnail(field, thumbnail.url)
@@ -15,7 +15,10 @@ def webhook(request: HttpRequest):
         results = Video.objects.get(video_id=video_id, subscription__channel_id=subscription_id, subscription__provider="Youtube")
 
         if results:
+            results.needs_sync = True
+            results.save()
             tasks.synchronize_video(results)
+            tasks.synchronize_video_stats.delay([results.subscription_id])
         else:
             video_title = entry.find("{http://www.w3.org/2005/Atom}title").text
 
@@ -32,3 +35,4 @@ def webhook(request: HttpRequest):
             video.save()
 
             tasks.synchronize_video(video)
+            tasks.synchronize_video_stats.delay([video.subscription_id])
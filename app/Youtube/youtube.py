@@ -1,14 +1,41 @@
+import threading
 from typing import Optional
 
-from external.pytaw.pytaw.youtube import YouTube, Thumbnail, Resource
+from external.pytaw.pytaw.youtube import YouTube, Thumbnail, Resource, Query
+
+# Quota units charged by the Data API for one request to each endpoint (each page of results is a request)
+ENDPOINT_COSTS = {
+    'search': 100,
+    'videos': 1,
+    'channels': 1,
+    'subscriptions': 1,
+    'playlists': 1,
+    'playlist_items': 1,
+}
+
+
+# Clients built by build_public(), per thread since the underlying HTTP connection is not thread safe
+_clients = threading.local()
 
 
 class YoutubeAPI(YouTube):
 
     @staticmethod
     def build_public() -> 'YoutubeAPI':
+        """
+        Gets a client using the configured API key. The client, and its connections, are reused by the following
+        calls from the same thread, until the key is changed.
+        """
         from YtManagerApp.management.appconfig import appconfig
-        return YoutubeAPI(key=appconfig.youtube_api_key)
+        key = appconfig.youtube_api_key
+
+        if getattr(_clients, 'key', None) != key:
+            api = YoutubeAPI(key=key)
+            api.query_hooks.append(charge_query)
+            _clients.api = api
+            _clients.key = key
+
+        return _clients.api
 
     # @staticmethod
     # def build_oauth() -> 'YoutubeAPI':
@@ -17,6 +44,15 @@ class YoutubeAPI(YouTube):
     #     service = build(API_SERVICE_NAME, API_VERSION, credentials)
 
 
+def charge_query(query: Query, api_params: dict):
+    """
+    Records the quota cost of a query before it is sent. Raises QuotaExceeded instead if the daily budget left for
+    the current priority is too low.
+    """
+    from YtManagerApp.management import api_quota
+    api_quota.spend('Youtube', query.endpoint, ENDPOINT_COSTS.get(query.endpoint, 1))
+
+
 def default_thumbnail(resource: Resource) -> Optional[Thumbnail]:
     """
     Gets the default thumbnail for a resource.
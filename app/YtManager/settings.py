@@ -262,6 +262,71 @@ WSGI_APPLICATION = 'YtManager.wsgi.application'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'django-cache'
 CELERY_BROKER_URL = get_global_opt('RedisUrl', cfg, env_variable='YTSM_REDIS_URL', fallback='redis://')
+# Redis delivers a task to another worker if it wasn't acknowledged after this many seconds. Tasks scheduled for
+# later are only acknowledged when they run, so countdowns (e.g. download retries) must stay well below it.
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 12 * 60 * 60}
+
+# The registry of downloaded files is compared with the download directories every this many hours
+FILE_REGISTRY_SCAN_HOURS = get_global_opt('FileRegistryScanHours', cfg, env_variable='YTSM_FILE_REGISTRY_SCAN_HOURS',
+                                          fallback=24, integer=True)
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-video-files': {
+        'task': 'YtManagerApp.tasks.reconcile_video_files',
+        'schedule': FILE_REGISTRY_SCAN_HOURS * 60 * 60,
+    },
+    # Downloads whose worker stopped sending heartbeats for DownloadState.STALE_AFTER (e.g. a worker which was killed)
+    # are resumed, without waiting for a worker to restart
+    'resume-interrupted-downloads': {
+        'task': 'YtManagerApp.tasks.resume_interrupted_downloads',
+        'schedule': 15 * 60,
+    },
+}
+
+# Synchronizations requested while using the UI (e.g. marking videos watched) are delayed by this many seconds, so
+# that repeated requests for the same subscription are merged into one
+SYNC_DEBOUNCE_SECONDS = get_global_opt('SyncDebounceSeconds', cfg, env_variable='YTSM_SYNC_DEBOUNCE_SECONDS',
+                                       fallback=30, integer=True)
+
+# Units of YouTube Data API quota which can be spent per day (the default quota of an API key is 10000 units)
+YOUTUBE_API_DAILY_QUOTA = get_global_opt('YoutubeApiDailyQuota', cfg, env_variable='YTSM_YOUTUBE_API_DAILY_QUOTA',
+                                         fallback=10000, integer=True)
+
+# Number of videos downloaded at the same time by all the workers together, in total and from a single site
+DOWNLOAD_CONCURRENCY = get_global_opt('DownloadConcurrency', cfg, env_variable='YTSM_DOWNLOAD_CONCURRENCY',
+                                      fallback=4, integer=True)
+DOWNLOAD_CONCURRENCY_PER_HOST = get_global_opt('DownloadConcurrencyPerHost', cfg,
+                                               env_variable='YTSM_DOWNLOAD_CONCURRENCY_PER_HOST',
+                                               fallback=3, integer=True)
+
+# Downloaded videos may be handed off to the front web server instead of being streamed by Django:
+# 'nginx' answers with an X-Accel-Redirect to VIDEO_ACCEL_REDIRECT_LOCATION, which must be an internal location
+# serving VIDEO_ACCEL_REDIRECT_ROOT; 'sendfile' answers with an X-Sendfile header (Apache, lighttpd).
+# Files outside VIDEO_ACCEL_REDIRECT_ROOT are always streamed by Django.
+VIDEO_SERVE_MODE = get_global_opt('VideoServeMode', cfg, env_variable='YTSM_VIDEO_SERVE_MODE', fallback='django')
+VIDEO_ACCEL_REDIRECT_LOCATION = get_global_opt('VideoAccelRedirectLocation', cfg,
+                                               env_variable='YTSM_VIDEO_ACCEL_REDIRECT_LOCATION',
+                                               fallback='/protected-videos/')
+VIDEO_ACCEL_REDIRECT_ROOT = get_global_opt('VideoAccelRedirectRoot', cfg, env_variable='YTSM_VIDEO_ACCEL_REDIRECT_ROOT',
+                                           fallback=DATA_DIR)
+
+# Cache
+# The cached results are invalidated by the workers as well as the web server, so the cache must be shared between
+# processes; without a Redis URL, it is kept in a database table (created by the migrations).
+_CACHE_URL = get_global_opt('CacheUrl', cfg, env_variable='YTSM_CACHE_URL', fallback=None)
+if _CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': _CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'ytsm_result_cache',
+        }
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
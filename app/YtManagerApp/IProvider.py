@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from typing import List
+
 from YtManagerApp.models import Video, Subscription
 
 
@@ -8,11 +10,21 @@ class IProvider(ABC):
     def download_video(video: Video):
         pass
 
+    @classmethod
+    def download_videos(cls, videos: List[Video]):
+        for video in videos:
+            cls.download_video(video)
+
     @staticmethod
     @abstractmethod
     def synchronise_channel(subscription: Subscription):
         pass
 
+    @classmethod
+    def synchronise_channels(cls, subscriptions: List[Subscription]):
+        for subscription in subscriptions:
+            cls.synchronise_channel(subscription)
+
     @staticmethod
     @abstractmethod
     def process_url(url: str, subscription: Subscription) -> bool:
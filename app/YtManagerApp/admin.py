@@ -1,6 +1,13 @@
 from django.contrib import admin
-from .models import SubscriptionFolder, Subscription, Video
+from .models import SubscriptionFolder, Subscription, Video, FeedCache, SubscriptionSyncState, \
+    ApiQuotaUsage, DownloadState, DownloadSlot, VideoFile
 
 admin.site.register(SubscriptionFolder)
 admin.site.register(Subscription)
 admin.site.register(Video)
+admin.site.register(FeedCache)
+admin.site.register(SubscriptionSyncState)
+admin.site.register(ApiQuotaUsage)
+admin.site.register(DownloadState)
+admin.site.register(DownloadSlot)
+admin.site.register(VideoFile)
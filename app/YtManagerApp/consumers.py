@@ -41,6 +41,8 @@ class EventConsumer(WebsocketConsumer):
 
         response = EventConsumer.search_recent_tasks("Synchronize All", all_children, "YtManagerApp.tasks.synchronize_all")
         response += EventConsumer.search_recent_tasks("Synchronize Folder", all_children, "YtManagerApp.tasks.synchronize_folder")
+        response += EventConsumer.search_recent_tasks("Synchronize Subscriptions", all_children, "YtManagerApp.tasks.run_queued_syncs")
+        response += EventConsumer.search_recent_tasks("Synchronize YouTube Channels", all_children, 'Youtube.tasks.synchronize_channels')
         response += EventConsumer.search_recent_tasks("Synchronize YouTube Channel", all_children, 'Youtube.tasks.synchronize_channel')
         response += EventConsumer.search_recent_tasks("Synchronize Twitch Channel", all_children, 'Twitch.tasks.synchronize_channel')
 
@@ -0,0 +1,134 @@
+import contextlib
+import contextvars
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+import pytz
+from django.conf import settings
+from django.db.models import F, Sum
+
+from YtManagerApp.models import ApiQuotaUsage
+
+# Priorities of API calls, from the most to the least important. Each priority may only use a share of the daily
+# budget, so that when quota runs low, finding new videos goes on while refreshing statistics is postponed.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DISCOVERY = 1
+PRIORITY_STATS = 2
+
+PRIORITY_BUDGET_SHARE = {
+    PRIORITY_INTERACTIVE: 1.0,
+    PRIORITY_DISCOVERY: 0.95,
+    PRIORITY_STATS: 0.8,
+}
+
+# The YouTube quota is reset at midnight, Pacific time
+QUOTA_TIMEZONE = pytz.timezone('America/Los_Angeles')
+
+log = logging.getLogger('api_quota')
+
+# Subscription and priority which the API calls made in the current context are charged to
+__context = contextvars.ContextVar('api_quota_context', default=(None, PRIORITY_INTERACTIVE))
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised instead of making an API call, when the daily budget left for the call's priority is spent.
+    """
+    pass
+
+
+@contextlib.contextmanager
+def charge_to(subscription_id: Optional[int], priority: int):
+    """
+    Charges the API calls made inside the block to a subscription, with the given priority.
+    """
+    token = __context.set((subscription_id, priority))
+    try:
+        yield
+    finally:
+        __context.reset(token)
+
+
+def spend(provider: str, endpoint: str, units: int):
+    """
+    Records an API call about to be made, or refuses it if the daily budget left for the current priority is
+    too low. Providers call this before each request.
+    :param provider: Provider name
+    :param endpoint: API endpoint
+    :param units: Quota cost of the call
+    :raises QuotaExceeded: The call should not be made
+    """
+    subscription_id, priority = __context.get()
+
+    if not can_spend(provider, priority, units):
+        __record(provider, endpoint, subscription_id, deferred=1)
+        raise QuotaExceeded(f'{provider} API quota left for priority {priority} is too low to call {endpoint}')
+
+    __record(provider, endpoint, subscription_id, calls=1, units=units)
+
+
+def can_spend(provider: str, priority: int, units: int = 1) -> bool:
+    """
+    Checks whether a call of the given priority and cost fits in what is left of the day's budget.
+    """
+    budget = get_budget(provider)
+    if budget is None:
+        return True
+    return get_used(provider) + units <= budget * PRIORITY_BUDGET_SHARE[priority]
+
+
+def get_budget(provider: str) -> Optional[int]:
+    """
+    Gets the number of quota units a provider may use per day, or None if it is not limited.
+    """
+    if provider == 'Youtube':
+        return settings.YOUTUBE_API_DAILY_QUOTA
+    return None
+
+
+def get_used(provider: str, day: Optional[datetime.date] = None) -> int:
+    """
+    Gets the number of quota units a provider used on a day (today by default).
+    """
+    return ApiQuotaUsage.objects \
+        .filter(provider=provider, day=day or get_quota_day()) \
+        .aggregate(total=Sum('units'))['total'] or 0
+
+
+def get_quota_day() -> datetime.date:
+    return datetime.datetime.now(QUOTA_TIMEZONE).date()
+
+
+def get_usage_by_subscription(days: int = 7) -> List[Dict]:
+    """
+    Sums up the quota spent per subscription over the last days, most expensive first.
+    :return: List of dicts, with subscription__name, provider, calls, units and deferred
+    """
+    since = get_quota_day() - datetime.timedelta(days=days - 1)
+    return list(ApiQuotaUsage.objects
+                .filter(day__gte=since)
+                .values('subscription_id', 'subscription__name', 'provider')
+                .annotate(calls=Sum('calls'), units=Sum('units'), deferred=Sum('deferred'))
+                .order_by('-units'))
+
+
+def get_usage_by_endpoint(day: Optional[datetime.date] = None) -> List[Dict]:
+    """
+    Sums up the quota spent per endpoint on a day (today by default).
+    :return: List of dicts, with provider, endpoint, calls, units and deferred
+    """
+    return list(ApiQuotaUsage.objects
+                .filter(day=day or get_quota_day())
+                .values('provider', 'endpoint')
+                .annotate(calls=Sum('calls'), units=Sum('units'), deferred=Sum('deferred'))
+                .order_by('-units'))
+
+
+def __record(provider: str, endpoint: str, subscription_id: Optional[int], calls=0, units=0, deferred=0):
+    usage = ApiQuotaUsage.objects.filter(day=get_quota_day(), provider=provider, endpoint=endpoint,
+                                         subscription_id=subscription_id)
+    updated = usage.update(calls=F('calls') + calls, units=F('units') + units, deferred=F('deferred') + deferred)
+    if updated == 0:
+        ApiQuotaUsage.objects.create(day=get_quota_day(), provider=provider, endpoint=endpoint,
+                                     subscription_id=subscription_id, calls=calls, units=units, deferred=deferred)
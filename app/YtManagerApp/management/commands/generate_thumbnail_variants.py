@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from YtManagerApp.management import thumbnails
+from YtManagerApp.models import Subscription, Video
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized thumbnail variants for thumbnails stored before variants were introduced.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for model in (Subscription, Video):
+            for instance in model.objects.exclude(Q(thumb='') | Q(thumb__isnull=True)).only('id', 'thumb'):
+                try:
+                    thumbnails.generate_variants(instance.thumb.path, thumbnails.variant_size(instance.thumb))
+                    count += 1
+                except OSError as e:
+                    self.stderr.write(f'Could not resize {instance.thumb.name}: {e}')
+
+        self.stdout.write(f'Processed {count} thumbnails.')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from YtManagerApp.management import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full text search index of the videos, creating it if necessary.'
+
+    def handle(self, *args, **options):
+        if search.rebuild():
+            self.stdout.write('Search index rebuilt.')
+        else:
+            self.stdout.write('Full text search is not supported by this database, substring search is used instead.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from YtManagerApp.models import Subscription
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the unwatched, downloaded and total video counters of all subscriptions.'
+
+    def handle(self, *args, **options):
+        fixed = Subscription.recount_counters()
+        self.stdout.write(f'Fixed the counters of {fixed} subscriptions.')
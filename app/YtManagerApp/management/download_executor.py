@@ -0,0 +1,231 @@
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import urlsplit
+
+import youtube_dl
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+
+from YtManagerApp.models import DownloadSlot, DownloadState
+
+log = logging.getLogger('download_executor')
+
+# Heartbeats of the running downloads are sent every this many seconds
+HEARTBEAT_INTERVAL = 60
+
+__lock = threading.Lock()
+__executor: Optional[ThreadPoolExecutor] = None
+__executor_pid: Optional[int] = None
+__heartbeats: Set[Callable[[], None]] = set()
+__stats = {
+    'completed': 0,
+    'failed': 0,
+    'bytes': 0,
+    'seconds': 0.0,
+}
+
+
+class DownloadResult(object):
+    """
+    Outcome of a youtube-dl download.
+    """
+
+    def __init__(self, url: str, return_code: int, downloaded_bytes: int, elapsed: float):
+        self.url = url
+        self.return_code = return_code
+        self.downloaded_bytes = downloaded_bytes
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f'download of {self.url}: code {self.return_code}, {self.downloaded_bytes} bytes in {self.elapsed:.1f}s'
+
+    @property
+    def throughput(self) -> float:
+        """
+        Average download speed, in bytes per second.
+        """
+        return self.downloaded_bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def acquire_slot(url: str) -> Optional[str]:
+    """
+    Takes one of the download slots shared by all the workers, so that at most DOWNLOAD_CONCURRENCY downloads run at
+    the same time, and at most DOWNLOAD_CONCURRENCY_PER_HOST from the host of the URL, whatever the number of worker
+    processes. Slots whose download stopped sending heartbeats (e.g. a killed worker) are taken over.
+
+    Each slot is a row, taken with a single conditional UPDATE, like the synchronization locks.
+    :param url: URL of the video page
+    :return: Token of the slot, to pass to submit() and release_slot(); None if the slots are all taken
+    """
+    token = uuid.uuid4().hex
+    if not __claim('all', settings.DOWNLOAD_CONCURRENCY, token):
+        return None
+    if not __claim(urlsplit(url).netloc, settings.DOWNLOAD_CONCURRENCY_PER_HOST, token):
+        release_slot(token)
+        return None
+    return token
+
+
+def release_slot(token: str):
+    """
+    Frees the download slots taken by acquire_slot().
+    """
+    DownloadSlot.objects.filter(token=token).update(token='', heartbeat_at=None)
+
+
+def submit(url: str, youtube_dl_params: dict, slot: Optional[str] = None,
+           on_start: Optional[Callable[[], None]] = None,
+           heartbeat: Optional[Callable[[], None]] = None) -> Future:
+    """
+    Queues a download in the worker's download pool, which runs at most DOWNLOAD_CONCURRENCY downloads at the same
+    time. The limits shared with the other workers are enforced by the slot.
+    :param url: URL of the video page
+    :param youtube_dl_params: youtube-dl options; the output directory is created before youtube-dl starts
+    :param slot: Token returned by acquire_slot(); the slot is kept while the download runs, and released by the caller
+    :param on_start: Called from the pool thread when the download leaves the queue and starts
+    :param heartbeat: Called every HEARTBEAT_INTERVAL seconds from a timer thread from the start of the download
+    until it ends, post-processing included
+    :return: Future which resolves to a DownloadResult, or to the exception raised by youtube-dl
+    """
+    return __get_executor().submit(__download_and_close, url, youtube_dl_params, slot, on_start, heartbeat)
+
+
+def download(url: str, youtube_dl_params: dict, slot: Optional[str] = None) -> DownloadResult:
+    """
+    Downloads a video through the worker's download pool, and waits for the download to finish.
+    """
+    return submit(url, youtube_dl_params, slot).result()
+
+
+def prepare_output_dir(output_template: str):
+    """
+    Creates the directory a youtube-dl output template points to. youtube-dl checks whether the directory exists
+    before creating it, which fails when several downloads create the same directory at the same time.
+    """
+    directory = os.path.dirname(output_template)
+    # Directories named after youtube-dl fields are only known once the video information is loaded
+    if directory and '%(' not in directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def get_stats() -> Dict[str, float]:
+    """
+    Gets the number of downloads completed and failed by the current process, and their average speed.
+    """
+    with __lock:
+        stats = dict(__stats)
+    stats['throughput'] = stats['bytes'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return stats
+
+
+def log_stats():
+    stats = get_stats()
+    log.info('Downloads: %d completed, %d failed, %.1f MB at %.2f MB/s on average',
+             stats['completed'], stats['failed'], stats['bytes'] / 1e6, stats['throughput'] / 1e6)
+
+
+def __get_executor() -> ThreadPoolExecutor:
+    global __executor, __executor_pid
+    with __lock:
+        # Threads are not inherited by forked worker processes
+        if __executor is None or __executor_pid != os.getpid():
+            __executor = ThreadPoolExecutor(max_workers=settings.DOWNLOAD_CONCURRENCY, thread_name_prefix='downloads')
+            __executor_pid = os.getpid()
+            __heartbeats.clear()
+            threading.Thread(target=__send_heartbeats, name='download-heartbeats', daemon=True).start()
+        return __executor
+
+
+def __send_heartbeats():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with __lock:
+            heartbeats = list(__heartbeats)
+
+        for heartbeat in heartbeats:
+            try:
+                heartbeat()
+            except Exception as e:
+                log.error('Download heartbeat failed: %s', e)
+        close_old_connections()
+
+
+def __claim(group: str, count: int, token: str) -> bool:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stale = now - DownloadState.STALE_AFTER
+    names = [f'{group}/{i}' for i in range(count)]
+
+    DownloadSlot.objects.bulk_create([DownloadSlot(name=name) for name in names], ignore_conflicts=True)
+    for name in names:
+        if DownloadSlot.objects \
+                .filter(Q(token='') | Q(heartbeat_at__lt=stale), name=name) \
+                .update(token=token, heartbeat_at=now) > 0:
+            return True
+    return False
+
+
+def __download_and_close(url: str, youtube_dl_params: dict, slot: Optional[str],
+                         on_start: Optional[Callable[[], None]],
+                         heartbeat: Optional[Callable[[], None]]) -> DownloadResult:
+    try:
+        return __download(url, youtube_dl_params, slot, on_start, heartbeat)
+    finally:
+        # Progress hooks may use the database from the pool threads
+        close_old_connections()
+
+
+def __download(url: str, youtube_dl_params: dict, slot: Optional[str], on_start: Optional[Callable[[], None]],
+               heartbeat: Optional[Callable[[], None]]) -> DownloadResult:
+    finished_bytes = []
+
+    def progress_hook(status: dict):
+        # Formats which are merged afterwards (e.g. video and audio) are reported as separate files
+        if status['status'] == 'finished':
+            finished_bytes.append(status.get('total_bytes') or status.get('downloaded_bytes') or 0)
+
+    def send_heartbeat():
+        if slot is not None:
+            DownloadSlot.objects.filter(token=slot).update(heartbeat_at=datetime.datetime.now(datetime.timezone.utc))
+        if heartbeat is not None:
+            heartbeat()
+
+    params = dict(youtube_dl_params)
+    params['progress_hooks'] = list(params.get('progress_hooks', [])) + [progress_hook]
+
+    if on_start is not None:
+        on_start()
+    prepare_output_dir(params.get('outtmpl', ''))
+
+    start = time.monotonic()
+    with __lock:
+        __heartbeats.add(send_heartbeat)
+    try:
+        with youtube_dl.YoutubeDL(params) as yt:
+            return_code = yt.download([url])
+    except Exception:
+        __record(False, 0, 0)
+        raise
+    finally:
+        with __lock:
+            __heartbeats.discard(send_heartbeat)
+    elapsed = time.monotonic() - start
+
+    result = DownloadResult(url, return_code, sum(finished_bytes), elapsed)
+    __record(return_code == 0, result.downloaded_bytes, elapsed)
+    log.info('Downloaded %s with code %d: %.1f MB in %.0f seconds (%.2f MB/s)',
+             url, return_code, result.downloaded_bytes / 1e6, elapsed, result.throughput / 1e6)
+    return result
+
+
+def __record(success: bool, downloaded_bytes: int, elapsed: float):
+    with __lock:
+        __stats['completed' if success else 'failed'] += 1
+        __stats['bytes'] += downloaded_bytes
+        __stats['seconds'] += elapsed
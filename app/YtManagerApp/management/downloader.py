@@ -1,60 +1,188 @@
+import datetime
 import logging
+from typing import Dict, Iterable, List
 
 import os
 from django.contrib.auth.models import User
+from django.db.models import Count
 
-from YtManagerApp.models import Video, Subscription, VIDEO_ORDER_MAPPING
+from YtManagerApp.management.appconfig import appconfig
+from YtManagerApp.models import Video, Subscription, DownloadState, VIDEO_ORDER_MAPPING
 from YtManagerApp.utils import first_non_null
 
 log = logging.getLogger('downloader')
 log.setLevel(os.environ.get('LOGLEVEL', 'INFO').upper())
 
+# Size assumed for a video which is yet to be downloaded, when nothing was downloaded before to compare with
+DEFAULT_VIDEO_SIZE = 500 * 1024 * 1024
+
+# Fields loaded for planning; the counted fields are needed so evicted videos update the subscription counters
+__PLAN_FIELDS = ('id', 'video_id', 'name', 'subscription_id', 'watched', 'downloaded_path', 'downloaded_size',
+                 'publish_date', 'playlist_index', 'views', 'rating')
+
+
+class DownloadPlan(object):
+    """
+    Videos to download for a user, and the downloaded videos to delete first to make room for them.
+    """
+
+    def __init__(self):
+        self.downloads: List[Video] = []
+        self.evictions: List[Video] = []
+        # estimated space used once the plan is carried out, in bytes
+        self.expected_size = 0
+        self.expected_count = 0
+
+    def __repr__(self):
+        return f'download plan: {len(self.downloads)} downloads, {len(self.evictions)} evictions, ' \
+               f'{self.expected_count} videos using {self.expected_size} bytes'
+
+
+def plan_downloads(user: User) -> DownloadPlan:
+    """
+    Picks the videos to download for a user, across all of their subscriptions at once.
+
+    Each subscription contributes its unwatched videos in its download order, up to its own limit. The selection is
+    then ordered with the user's download order, and accepted while the total number of videos and the space used
+    stay within the global limits. Watched videos of subscriptions which delete watched videos are evicted, oldest
+    first, when that makes room for the next video.
+
+    The space a video will use is estimated from the average size of the subscription's downloaded videos.
+    :param user: User
+    :return: Plan, which is not carried out yet
+    """
+    plan = DownloadPlan()
+
+    subscriptions: Dict[int, Subscription] = Subscription.objects.filter(user=user).in_bulk()
+    for sub in subscriptions.values():
+        sub.user = user
+
+    pending = dict(DownloadState.get_pending()
+                   .filter(video__subscription__user=user)
+                   .values('video__subscription_id')
+                   .annotate(count=Count('pk'))
+                   .values_list('video__subscription_id', 'count'))
+
+    estimates = __get_size_estimates(subscriptions.values())
+    used_count = sum(sub.downloaded_count + pending.get(sub.id, 0) for sub in subscriptions.values())
+    used_size = sum(sub.downloaded_size + pending.get(sub.id, 0) * estimates[sub.id] for sub in subscriptions.values())
+
+    count_limit = user.preferences['download_global_limit']
+    size_limit = user.preferences['download_global_size_limit']
+    size_limit = size_limit * 1024 * 1024 if size_limit is not None and size_limit > 0 else None
 
-def __get_subscription_config(sub: Subscription):
-    user: User = sub.user
+    def fits(count: int, size: int) -> bool:
+        return (count_limit is None or count_limit <= 0 or count <= count_limit) \
+               and (size_limit is None or size <= size_limit)
+
+    # Candidates of all subscriptions, with a single query
+    enabled_ids = [sub.id for sub in subscriptions.values() if appconfig.for_sub(sub, 'auto_download')]
+    candidates: Dict[int, List[Video]] = {}
+    for video in Video.objects \
+            .filter(subscription_id__in=enabled_ids, downloaded_path__isnull=True, watched=False) \
+            .exclude(id__in=DownloadState.get_pending().values('video_id')) \
+            .only(*__PLAN_FIELDS):
+        candidates.setdefault(video.subscription_id, []).append(video)
+
+    selected = []
+    for sub_id, videos in candidates.items():
+        sub = subscriptions[sub_id]
+        videos = __sort(videos, VIDEO_ORDER_MAPPING[appconfig.for_sub(sub, 'download_order')])
+
+        limit = first_non_null(sub.download_limit, user.preferences['download_subscription_limit'])
+        if limit is not None and limit > 0:
+            videos = videos[0:max(limit - sub.downloaded_count - pending.get(sub_id, 0), 0)]
+
+        selected.extend(videos)
+
+    # Watched videos which may be deleted, oldest first
+    evictable_ids = [sub.id for sub in subscriptions.values()
+                     if appconfig.for_sub(sub, 'automatically_delete_watched')]
+    evictable = list(Video.objects
+                     .filter(subscription_id__in=evictable_ids, watched=True, downloaded_path__isnull=False)
+                     .order_by('publish_date')
+                     .only(*__PLAN_FIELDS))
+    evictable.reverse()
+
+    for video in __sort(selected, VIDEO_ORDER_MAPPING[user.preferences['download_order']]):
+        size = estimates[video.subscription_id]
+
+        # Fewest watched videos to delete for the video to fit; nothing is deleted if that isn't enough
+        evict_count, freed_size = 0, 0
+        while not fits(used_count + 1 - evict_count, used_size + size - freed_size) and evict_count < len(evictable):
+            evict_count += 1
+            freed_size += evictable[-evict_count].downloaded_size
+
+        if not fits(used_count + 1 - evict_count, used_size + size - freed_size):
+            break
+
+        for _ in range(evict_count):
+            plan.evictions.append(evictable.pop())
+        used_count -= evict_count
+        used_size -= freed_size
+
+        video.subscription = subscriptions[video.subscription_id]
+        plan.downloads.append(video)
+        used_count += 1
+        used_size += size
+
+    plan.expected_count = used_count
+    plan.expected_size = used_size
+    return plan
+
+
+def process_user(user: User):
+    """
+    Plans the downloads of a user, deletes the evicted videos and queues the downloads.
+    """
+    plan = plan_downloads(user)
+    log.info('Planned downloads for user %s: %r', user.username, plan)
+
+    for video in plan.evictions:
+        log.info('Deleting watched video %d [%s %s] to make room', video.id, video.video_id, video.name)
+        video.delete_files(synchronize=False)
+
+    if len(plan.downloads) == 0:
+        return
+
+    # Marked as queued, so that the next plans don't pick them again
+    now = datetime.datetime.now(datetime.timezone.utc)
+    video_ids = [video.id for video in plan.downloads]
+    DownloadState.objects.bulk_create([DownloadState(video_id=video_id) for video_id in video_ids],
+                                      ignore_conflicts=True)
+    DownloadState.objects.filter(video_id__in=video_ids).update(status='queued', updated_at=now)
+
+    videos_by_provider = {}
+    for video in plan.downloads:
+        log.info('Enqueuing video %d [%s %s] index=%d', video.id, video.video_id, video.name, video.playlist_index)
+        videos_by_provider.setdefault(video.subscription.provider, []).append(video)
+
+    for videos in videos_by_provider.values():
+        videos[0].subscription.get_provider().download_videos(videos)
+
+
+def process_users(users: Iterable[User]):
+    for user in users:
+        process_user(user)
+
+
+def process_all():
+    process_users(User.objects.filter(subscription__isnull=False).distinct())
+
+
+def __get_size_estimates(subscriptions: Iterable[Subscription]) -> Dict[int, int]:
+    subscriptions = list(subscriptions)
+    total_count = sum(sub.downloaded_count for sub in subscriptions)
+    total_size = sum(sub.downloaded_size for sub in subscriptions)
+    default = total_size // total_count if total_count > 0 and total_size > 0 else DEFAULT_VIDEO_SIZE
+
+    return {
+        sub.id: sub.downloaded_size // sub.downloaded_count if sub.downloaded_count > 0 and sub.downloaded_size > 0
+        else default
+        for sub in subscriptions
+    }
 
-    enabled = first_non_null(sub.auto_download, user.preferences['auto_download'])
-    global_limit = user.preferences['download_global_limit']
-    limit = first_non_null(sub.download_limit, user.preferences['download_subscription_limit'])
-    order = first_non_null(sub.download_order, user.preferences['download_order'])
-    order = VIDEO_ORDER_MAPPING[order]
 
-    return enabled, global_limit, limit, order
-
-
-def downloader_process_subscription(sub: Subscription):
-    log.info('Processing subscription %d [%s %s]', sub.id, sub.playlist_id, sub.id)
-
-    enabled, global_limit, limit, order = __get_subscription_config(sub)
-    log.info('Determined settings enabled=%s global_limit=%d limit=%d order="%s"', enabled, global_limit, limit, order)
-
-    if enabled:
-        videos_to_download = Video.objects\
-            .filter(subscription=sub, downloaded_path__isnull=True, watched=False)\
-            .order_by(order)
-
-        log.info('%d download candidates.', len(videos_to_download))
-
-        if global_limit > 0:
-            global_downloaded = Video.objects.filter(subscription__user=sub.user, downloaded_path__isnull=False).count()
-            allowed_count = max(global_limit - global_downloaded, 0)
-            videos_to_download = videos_to_download[0:allowed_count]
-            log.info('Global limit is set, can only download up to %d videos.', allowed_count)
-
-        if limit > 0:
-            sub_downloaded = Video.objects.filter(subscription=sub, downloaded_path__isnull=False).count()
-            allowed_count = max(limit - sub_downloaded, 0)
-            videos_to_download = videos_to_download[0:allowed_count]
-            log.info('Limit is set, can only download up to %d videos.', allowed_count)
-
-        # enqueue download
-        for video in videos_to_download:
-            log.info('Enqueuing video %d [%s %s] index=%d', video.id, video.video_id, video.name, video.playlist_index)
-            video.subscription.get_provider().download_video(video)
-
-    log.info('Finished processing subscription %d [%s %s]', sub.id, sub.playlist_id, sub.id)
-
-
-def downloader_process_all():
-    for subscription in Subscription.objects.all():
-        downloader_process_subscription(subscription)
+def __sort(videos: List[Video], order: str) -> List[Video]:
+    field = order.lstrip('-')
+    return sorted(videos, key=lambda video: (getattr(video, field), video.id), reverse=order.startswith('-'))
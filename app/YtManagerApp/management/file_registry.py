@@ -0,0 +1,132 @@
+import bisect
+import datetime
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Tuple
+
+from YtManagerApp.models import Video, VideoFile
+
+# Number of rows written per query when reconciling
+BATCH_SIZE = 500
+
+log = logging.getLogger('file_registry')
+
+
+def register(video: Video) -> List[VideoFile]:
+    """
+    Replaces the registered files of a video with the files found on disk next to its downloaded path.
+    Providers call this when a download completes.
+    :return: Registered files
+    """
+    VideoFile.objects.filter(video_id=video.id).delete()
+    if not video.downloaded_path:
+        return []
+
+    directory, file_pattern = os.path.split(video.downloaded_path)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        log.warning('Download directory %s of video %d [%s] does not exist', directory, video.id, video.video_id)
+        return []
+
+    files = [file for file in (__stat(video.id, os.path.join(directory, name))
+                               for name in __match(names, file_pattern))
+             if file is not None]
+    VideoFile.objects.bulk_create(files)
+    return files
+
+
+def reconcile() -> Dict[str, int]:
+    """
+    Brings the registry in line with the download directories: files which appeared are registered, files which
+    changed are updated, and files which disappeared or whose video is not downloaded any more are removed.
+    Each directory is listed once, whatever the number of videos in it. Directories which can't be listed are
+    skipped, and their files are left as registered.
+    :return: Number of files added, updated and removed
+    """
+    # Taken before the videos are read: providers mark a video as downloaded before registering its files, so every
+    # row here belongs to a video whose state is seen below. Rows registered in the meantime are left alone.
+    registered = {(file.video_id, file.path): file
+                  for file in VideoFile.objects.only('id', 'video_id', 'path', 'size', 'modified_at').iterator()}
+
+    videos_by_directory: Dict[str, List[Tuple[int, str]]] = {}
+    for video_id, downloaded_path in Video.objects \
+            .filter(downloaded_path__isnull=False) \
+            .exclude(downloaded_path='') \
+            .values_list('id', 'downloaded_path') \
+            .iterator():
+        directory, file_pattern = os.path.split(downloaded_path)
+        videos_by_directory.setdefault(directory, []).append((video_id, file_pattern))
+
+    added, updated = [], []
+    skipped_video_ids = set()
+    for directory, videos in videos_by_directory.items():
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            # The directory was deleted, and the files with it
+            continue
+        except OSError as e:
+            log.error('Cannot list download directory %s, its files are left as registered: %s', directory, e)
+            skipped_video_ids.update(video_id for video_id, _ in videos)
+            continue
+
+        for video_id, file_pattern in videos:
+            for name in __match(names, file_pattern):
+                found = __stat(video_id, os.path.join(directory, name))
+                if found is None:
+                    continue
+
+                file = registered.pop((video_id, found.path), None)
+                if file is None:
+                    added.append(found)
+                elif file.size != found.size or file.modified_at != found.modified_at:
+                    file.size = found.size
+                    file.modified_at = found.modified_at
+                    updated.append(file)
+
+    # Whatever wasn't found on disk is gone
+    removed_ids = [file.id for file in registered.values() if file.video_id not in skipped_video_ids]
+    for i in range(0, len(removed_ids), BATCH_SIZE):
+        VideoFile.objects.filter(id__in=removed_ids[i:i + BATCH_SIZE]).delete()
+
+    # Files registered by a download which completed meanwhile are already there
+    added_video_ids = list({file.video_id for file in added})
+    existing = set()
+    for i in range(0, len(added_video_ids), BATCH_SIZE):
+        existing.update(VideoFile.objects
+                        .filter(video_id__in=added_video_ids[i:i + BATCH_SIZE])
+                        .values_list('video_id', 'path'))
+    added = [file for file in added if (file.video_id, file.path) not in existing]
+    VideoFile.objects.bulk_create(added, batch_size=BATCH_SIZE)
+    VideoFile.objects.bulk_update(updated, ['size', 'modified_at'], batch_size=BATCH_SIZE)
+
+    stats = {'added': len(added), 'updated': len(updated), 'removed': len(removed_ids)}
+    log.info('Reconciled file registry over %d directories: %d added, %d updated, %d removed',
+             len(videos_by_directory), stats['added'], stats['updated'], stats['removed'])
+    return stats
+
+
+def __match(names: List[str], file_pattern: str) -> List[str]:
+    # Names starting with the pattern are next to each other once sorted
+    i = bisect.bisect_left(names, file_pattern)
+    matches = []
+    while i < len(names) and names[i].startswith(file_pattern):
+        matches.append(names[i])
+        i += 1
+    return matches
+
+
+def __stat(video_id: int, path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    mime, _ = mimetypes.guess_type(path)
+    return VideoFile(video_id=video_id,
+                     path=path,
+                     size=stat.st_size,
+                     modified_at=datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc),
+                     mime=mime or '')
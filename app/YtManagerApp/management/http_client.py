@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connections kept alive per host; the thumbnail downloader is the most concurrent user of the session
+POOL_SIZE = 10
+# Timeout, in seconds, of requests which don't set one
+DEFAULT_TIMEOUT = 30
+# Failed requests are retried after 0.5, 1, 2... seconds, or after the time the server asked for
+RETRIES = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True)
+
+log = logging.getLogger('http_client')
+
+__lock = threading.Lock()
+__session: Optional[requests.Session] = None
+__session_pid: Optional[int] = None
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool with retries and a default timeout, which counts the requests sent and the
+    connections opened, to tell how often connections are reused.
+    """
+
+    def __init__(self):
+        super().__init__(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRIES)
+        self.requests = 0
+
+    def send(self, request, timeout=None, **kwargs):
+        self.requests += 1
+        return super().send(request, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+    def get_connection_count(self) -> int:
+        # Pools evicted from the manager take their counters with them, so this is a lower bound
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in list(pools.keys()))
+
+
+def get_session() -> requests.Session:
+    """
+    Gets the HTTP session shared by the current process. Sessions are not shared with forked worker processes,
+    since their connections would be used by both processes.
+    """
+    global __session, __session_pid
+    with __lock:
+        if __session is None or __session_pid != os.getpid():
+            __session = requests.Session()
+            adapter = _PooledAdapter()
+            __session.mount('https://', adapter)
+            __session.mount('http://', adapter)
+            __session_pid = os.getpid()
+        return __session
+
+
+def get_stats() -> Dict[str, float]:
+    """
+    Gets the number of requests sent and connections opened by the current process' session.
+    """
+    requests_count = 0
+    connections = 0
+    if __session is not None and __session_pid == os.getpid():
+        adapter: _PooledAdapter = __session.get_adapter('https://')
+        requests_count = adapter.requests
+        connections = adapter.get_connection_count()
+
+    return {
+        'requests': requests_count,
+        'connections': connections,
+        'reuse_rate': 1 - connections / requests_count if requests_count > 0 else 0.0,
+    }
+
+
+def log_stats():
+    stats = get_stats()
+    log.info('HTTP session: %d requests over %d connections (%.0f%% reused)',
+             stats['requests'], stats['connections'], stats['reuse_rate'] * 100)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Cached results expire after this many seconds, even if they were not invalidated
+CACHE_TIMEOUT = 5 * 60
+
+# Kinds of cached results, each has its own hit/miss counters
+NAMESPACES = ('videos', 'totals', 'tree')
+
+
+def get_or_compute(user_id: int, namespace: str, params: dict, compute: Callable[[], Any],
+                   timeout: int = CACHE_TIMEOUT) -> Any:
+    """
+    Gets a result from the cache, or computes and caches it. The key contains the user's current version, so
+    results are dropped as soon as invalidate() is called for the user.
+    :param user_id: ID of the user owning the result
+    :param namespace: Kind of result, one of NAMESPACES
+    :param params: Parameters the result depends on; must be serializable to JSON
+    :param compute: Function computing the result, called on a miss
+    :param timeout: Time, in seconds, after which the result expires
+    :return: Result
+    """
+    params_hash = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    key = f'result_{namespace}_{user_id}_{__get_version(user_id)}_{params_hash}'
+
+    result = cache.get(key)
+    if result is not None:
+        __increment(f'result_stats_{namespace}_hits')
+        return result
+
+    __increment(f'result_stats_{namespace}_misses')
+    result = compute()
+    cache.set(key, result, timeout)
+    return result
+
+
+def invalidate(user_id: int):
+    """
+    Drops all the cached results of a user, once the current transaction is committed.
+    """
+    transaction.on_commit(lambda: __bump_version(user_id))
+
+
+def get_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Gets the hit/miss counters of each namespace, since the cache was last cleared.
+    """
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = cache.get(f'result_stats_{namespace}_hits', 0)
+        misses = cache.get(f'result_stats_{namespace}_misses', 0)
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.0,
+        }
+    return stats
+
+
+def __get_version(user_id: int) -> int:
+    key = f'result_version_{user_id}'
+    version = cache.get(key)
+    if version is None:
+        # Start from the current time, so results cached before the version was evicted are not reused
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def __bump_version(user_id: int):
+    try:
+        cache.incr(f'result_version_{user_id}')
+    except ValueError:
+        # No version yet; a fresh one will be picked on the next read
+        pass
+
+
+def __increment(key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
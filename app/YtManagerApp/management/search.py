@@ -0,0 +1,224 @@
+import logging
+import re
+from typing import List
+
+from django.db import connection as default_connection, OperationalError
+from django.db.models import Q, QuerySet
+
+log = logging.getLogger('search')
+
+VIDEO_TABLE = 'YtManagerApp_video'
+SUBSCRIPTION_TABLE = 'YtManagerApp_subscription'
+
+# SQLite: FTS5 table holding a copy of the searchable text, with rowid = video id.
+# Migrations which make SQLite rebuild the video or subscription table must drop the triggers before, and create
+# them again after, with a copy of the statements (see 0021_video_indexes).
+SQLITE_FTS_TABLE = 'YtManagerApp_video_fts'
+
+SQLITE_INSTALL = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS "{SQLITE_FTS_TABLE}"
+        USING fts5(name, description, uploader_name, subscription_name, tokenize = 'unicode61 remove_diacritics 2')''',
+    f'''CREATE TRIGGER IF NOT EXISTS "{SQLITE_FTS_TABLE}_insert" AFTER INSERT ON "{VIDEO_TABLE}" BEGIN
+            INSERT INTO "{SQLITE_FTS_TABLE}" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "{SUBSCRIPTION_TABLE}" s WHERE s.id = new.subscription_id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS "{SQLITE_FTS_TABLE}_update"
+        AFTER UPDATE OF name, description, uploader_name, subscription_id ON "{VIDEO_TABLE}" BEGIN
+            DELETE FROM "{SQLITE_FTS_TABLE}" WHERE rowid = old.id;
+            INSERT INTO "{SQLITE_FTS_TABLE}" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "{SUBSCRIPTION_TABLE}" s WHERE s.id = new.subscription_id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS "{SQLITE_FTS_TABLE}_delete" AFTER DELETE ON "{VIDEO_TABLE}" BEGIN
+            DELETE FROM "{SQLITE_FTS_TABLE}" WHERE rowid = old.id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS "{SQLITE_FTS_TABLE}_subscription_update"
+        AFTER UPDATE OF name ON "{SUBSCRIPTION_TABLE}" BEGIN
+            UPDATE "{SQLITE_FTS_TABLE}" SET subscription_name = new.name
+            WHERE rowid IN (SELECT id FROM "{VIDEO_TABLE}" WHERE subscription_id = new.id);
+        END''',
+]
+
+SQLITE_UNINSTALL = [
+    f'DROP TRIGGER IF EXISTS "{SQLITE_FTS_TABLE}_insert"',
+    f'DROP TRIGGER IF EXISTS "{SQLITE_FTS_TABLE}_update"',
+    f'DROP TRIGGER IF EXISTS "{SQLITE_FTS_TABLE}_delete"',
+    f'DROP TRIGGER IF EXISTS "{SQLITE_FTS_TABLE}_subscription_update"',
+    f'DROP TABLE IF EXISTS "{SQLITE_FTS_TABLE}"',
+]
+
+SQLITE_REBUILD = [
+    f'DELETE FROM "{SQLITE_FTS_TABLE}"',
+    f'''INSERT INTO "{SQLITE_FTS_TABLE}" (rowid, name, description, uploader_name, subscription_name)
+        SELECT v.id, v.name, v.description, v.uploader_name, s.name
+        FROM "{VIDEO_TABLE}" v INNER JOIN "{SUBSCRIPTION_TABLE}" s ON s.id = v.subscription_id''',
+]
+
+# PostgreSQL: weighted tsvector column on the video table, maintained by a trigger, with a GIN index
+POSTGRES_INSTALL = [
+    f'ALTER TABLE "{VIDEO_TABLE}" ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    f'CREATE INDEX IF NOT EXISTS "{VIDEO_TABLE}_search_idx" ON "{VIDEO_TABLE}" USING GIN (search_vector)',
+    f'''CREATE OR REPLACE FUNCTION ytmanagerapp_video_search_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.uploader_name, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(
+                    (SELECT name FROM "{SUBSCRIPTION_TABLE}" WHERE id = NEW.subscription_id), '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'D');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    f'DROP TRIGGER IF EXISTS ytmanagerapp_video_search ON "{VIDEO_TABLE}"',
+    f'''CREATE TRIGGER ytmanagerapp_video_search
+        BEFORE INSERT OR UPDATE OF name, description, uploader_name, subscription_id ON "{VIDEO_TABLE}"
+        FOR EACH ROW EXECUTE PROCEDURE ytmanagerapp_video_search_update()''',
+    f'''CREATE OR REPLACE FUNCTION ytmanagerapp_subscription_search_update() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.name IS DISTINCT FROM OLD.name THEN
+                UPDATE "{VIDEO_TABLE}" SET name = name WHERE subscription_id = NEW.id;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    f'DROP TRIGGER IF EXISTS ytmanagerapp_subscription_search ON "{SUBSCRIPTION_TABLE}"',
+    f'''CREATE TRIGGER ytmanagerapp_subscription_search
+        AFTER UPDATE OF name ON "{SUBSCRIPTION_TABLE}"
+        FOR EACH ROW EXECUTE PROCEDURE ytmanagerapp_subscription_search_update()''',
+]
+
+POSTGRES_UNINSTALL = [
+    f'DROP TRIGGER IF EXISTS ytmanagerapp_subscription_search ON "{SUBSCRIPTION_TABLE}"',
+    'DROP FUNCTION IF EXISTS ytmanagerapp_subscription_search_update()',
+    f'DROP TRIGGER IF EXISTS ytmanagerapp_video_search ON "{VIDEO_TABLE}"',
+    'DROP FUNCTION IF EXISTS ytmanagerapp_video_search_update()',
+    f'ALTER TABLE "{VIDEO_TABLE}" DROP COLUMN IF EXISTS search_vector',
+]
+
+POSTGRES_REBUILD = [
+    # the trigger recomputes the vector
+    f'UPDATE "{VIDEO_TABLE}" SET name = name',
+]
+
+__available = {}
+
+# Order of results by relevance when there is no rank to order by; the ID keeps pages stable
+__UNRANKED_ORDER = ('-publish_date', '-id')
+
+
+def install(connection=default_connection) -> bool:
+    """
+    Creates the full text index and the triggers which keep it in sync, if the database supports it.
+    :return: True if the index was created
+    """
+    if connection.vendor == 'sqlite':
+        try:
+            __execute(connection, SQLITE_INSTALL)
+        except OperationalError as e:
+            # SQLite may be built without FTS5
+            log.warning('Full text search is not available: %s', e)
+            return False
+        __execute(connection, SQLITE_REBUILD)
+    elif connection.vendor == 'postgresql':
+        __execute(connection, POSTGRES_INSTALL)
+        __execute(connection, POSTGRES_REBUILD)
+    else:
+        log.info('Full text search is not supported on %s, falling back to substring search.', connection.vendor)
+        return False
+
+    __available.pop(connection.alias, None)
+    return True
+
+
+def uninstall(connection=default_connection):
+    if connection.vendor == 'sqlite':
+        __execute(connection, SQLITE_UNINSTALL)
+    elif connection.vendor == 'postgresql':
+        __execute(connection, POSTGRES_UNINSTALL)
+    __available.pop(connection.alias, None)
+
+
+def rebuild(connection=default_connection) -> bool:
+    """
+    Repopulates the full text index from the videos table. The index is created if it doesn't exist.
+    :return: True if the database has a full text index
+    """
+    if not is_available(connection):
+        return install(connection)
+
+    if connection.vendor == 'sqlite':
+        __execute(connection, SQLITE_REBUILD)
+    elif connection.vendor == 'postgresql':
+        __execute(connection, POSTGRES_REBUILD)
+    return True
+
+
+def is_available(connection=default_connection) -> bool:
+    """
+    Checks whether the full text index exists in the given database. The result is cached for the process.
+    """
+    if connection.alias not in __available:
+        if connection.vendor == 'sqlite':
+            __available[connection.alias] = SQLITE_FTS_TABLE in connection.introspection.table_names()
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                               [VIDEO_TABLE, 'search_vector'])
+                __available[connection.alias] = cursor.fetchone() is not None
+        else:
+            __available[connection.alias] = False
+
+    return __available[connection.alias]
+
+
+def search_videos(videos: QuerySet, query: str, ranked: bool = False) -> QuerySet:
+    """
+    Filters a video queryset to the videos containing all the words in the query (as prefixes), in the name,
+    description, uploader name or subscription name.
+    :param videos: Video queryset
+    :param query: Query string, typed by the user
+    :param ranked: If set, the results are ordered by relevance; newest first if there is no full text index
+    :return: Filtered queryset; with a 'search_rank' attribute (higher is better) if a full text index is used
+    """
+    words = __get_words(query)
+    if len(words) == 0:
+        return videos.order_by(*__UNRANKED_ORDER) if ranked else videos
+
+    connection = default_connection
+    if connection.vendor == 'sqlite' and is_available(connection):
+        match = ' '.join(f'"{word}"*' for word in words)
+        # bm25 scores are lower for better matches; matches in the name weigh the most, like in PostgreSQL
+        videos = videos.extra(
+            select={'search_rank': f'-bm25("{SQLITE_FTS_TABLE}", 10.0, 1.0, 5.0, 5.0)'},
+            tables=[SQLITE_FTS_TABLE],
+            where=[f'"{SQLITE_FTS_TABLE}".rowid = "{VIDEO_TABLE}".id', f'"{SQLITE_FTS_TABLE}" MATCH %s'],
+            params=[match])
+    elif connection.vendor == 'postgresql' and is_available(connection):
+        ts_query = ' & '.join(f'{word}:*' for word in words)
+        videos = videos.extra(
+            select={'search_rank': "ts_rank(search_vector, to_tsquery('simple', %s))"},
+            select_params=[ts_query],
+            where=["search_vector @@ to_tsquery('simple', %s)"],
+            params=[ts_query])
+    else:
+        for word in words:
+            videos = videos.filter(Q(name__icontains=word)
+                                   | Q(description__icontains=word)
+                                   | Q(uploader_name__icontains=word)
+                                   | Q(subscription__name__icontains=word))
+        return videos.order_by(*__UNRANKED_ORDER) if ranked else videos
+
+    if ranked:
+        videos = videos.order_by('-search_rank', *__UNRANKED_ORDER)
+    return videos
+
+
+def __get_words(query: str) -> List[str]:
+    return [match[0] for match in re.finditer(r'\w+', query)]
+
+
+def __execute(connection, statements: List[str]):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
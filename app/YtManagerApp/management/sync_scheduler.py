@@ -0,0 +1,164 @@
+import datetime
+import logging
+import uuid
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q, F, Sum
+from django.utils import timezone
+
+from YtManagerApp.models import Subscription, SubscriptionSyncState, Video
+
+# A queued or running synchronization which didn't finish after this many seconds is considered lost (e.g. the
+# worker crashed), and doesn't block new requests any more
+SYNC_LOCK_TIMEOUT = 30 * 60
+# Synchronizations of many subscriptions at once extend the locks of the subscriptions they haven't reached yet this
+# often, so that long batches don't lose them
+SYNC_LOCK_REFRESH = SYNC_LOCK_TIMEOUT // 3
+
+# Periodic synchronizations visit a subscription about 4 times per interval between its uploads, within these bounds
+SYNC_CHECKS_PER_UPLOAD = 4
+MIN_SYNC_INTERVAL = datetime.timedelta(hours=1)
+MAX_SYNC_INTERVAL = datetime.timedelta(days=7)
+# Interval used for subscriptions without enough history
+DEFAULT_SYNC_INTERVAL = datetime.timedelta(days=1)
+# Number of recent uploads the interval is learned from
+UPLOAD_HISTORY_SIZE = 10
+
+log = logging.getLogger('sync_scheduler')
+
+
+def request_sync(subscriptions: Iterable[Subscription], debounce: bool = True) -> List[Subscription]:
+    """
+    Requests the synchronization of some subscriptions. Subscriptions which already have a synchronization queued
+    or running are skipped, and the request is counted as suppressed.
+
+    The lock is a row per subscription, taken with a single conditional UPDATE, so it holds across processes.
+    :param subscriptions: Subscriptions to synchronize
+    :param debounce: If set, the synchronization starts after SYNC_DEBOUNCE_SECONDS, so that more requests made in
+                     the meantime are merged into it
+    :return: Subscriptions for which a synchronization was queued
+    """
+    from YtManagerApp import tasks
+
+    subscriptions = {sub.id: sub for sub in subscriptions}
+    if len(subscriptions) == 0:
+        return []
+
+    acquired_ids = __acquire(subscriptions.keys())
+    suppressed = len(subscriptions) - len(acquired_ids)
+    if suppressed > 0:
+        log.info('Suppressed %d redundant synchronizations', suppressed)
+
+    if len(acquired_ids) > 0:
+        countdown = settings.SYNC_DEBOUNCE_SECONDS if debounce else 0
+        try:
+            tasks.run_queued_syncs.apply_async((acquired_ids,), countdown=countdown)
+        except Exception:
+            # e.g. the broker is down; nothing will run, so the locks must not wait for the timeout
+            release(acquired_ids)
+            raise
+
+    return [subscriptions[sub_id] for sub_id in acquired_ids]
+
+
+def start(subscription_ids: List[int]):
+    """
+    Marks queued synchronizations as running.
+    """
+    SubscriptionSyncState.objects.filter(subscription_id__in=subscription_ids).update(started_at=timezone.now())
+
+
+def refresh(subscription_ids: Iterable[int]):
+    """
+    Extends the locks of running synchronizations which didn't finish yet. Providers synchronizing many subscriptions
+    in one batch call this every SYNC_LOCK_REFRESH seconds with the subscriptions left.
+    """
+    SubscriptionSyncState.objects \
+        .filter(subscription_id__in=list(subscription_ids), started_at__isnull=False) \
+        .update(started_at=timezone.now())
+
+
+def finish(subscription_id: int):
+    """
+    Releases the lock of a subscription once its synchronization finished, and plans the next periodic one.
+    Providers call this at the end of each channel synchronization.
+    """
+    SubscriptionSyncState.objects \
+        .filter(subscription_id=subscription_id, started_at__isnull=False) \
+        .update(queued_at=None, started_at=None, token='')
+
+    next_sync_at = timezone.now() + get_sync_interval(subscription_id)
+    SubscriptionSyncState.objects.bulk_create([SubscriptionSyncState(subscription_id=subscription_id)],
+                                              ignore_conflicts=True)
+    SubscriptionSyncState.objects.filter(subscription_id=subscription_id).update(next_sync_at=next_sync_at)
+
+
+def release(subscription_ids: Iterable[int]):
+    """
+    Releases the locks of synchronizations which won't run, e.g. because their provider failed to start them, so
+    that new requests aren't suppressed until the lock times out. The next periodic synchronization is left as planned.
+    """
+    SubscriptionSyncState.objects \
+        .filter(subscription_id__in=list(subscription_ids)) \
+        .update(queued_at=None, started_at=None, token='')
+
+
+def get_due_subscriptions() -> models.QuerySet:
+    """
+    Gets the subscriptions which the periodic synchronization should visit now. Subscriptions which were never
+    planned (e.g. new ones) are always due.
+    """
+    return Subscription.objects.filter(Q(sync_state__isnull=True)
+                                       | Q(sync_state__next_sync_at__isnull=True)
+                                       | Q(sync_state__next_sync_at__lte=timezone.now()))
+
+
+def get_sync_interval(subscription_id: int) -> datetime.timedelta:
+    """
+    Works out how often a subscription should be synchronized, from the median time between its recent uploads.
+    Channels which haven't uploaded for longer than usual are checked less and less often.
+    """
+    dates = list(Video.objects
+                 .filter(subscription_id=subscription_id)
+                 .order_by('-publish_date')
+                 .values_list('publish_date', flat=True)[:UPLOAD_HISTORY_SIZE + 1])
+    if len(dates) < 2:
+        return DEFAULT_SYNC_INTERVAL
+
+    gaps = sorted(newer - older for newer, older in zip(dates, dates[1:]))
+    expected_gap = max(gaps[len(gaps) // 2], timezone.now() - dates[0])
+
+    return min(max(expected_gap / SYNC_CHECKS_PER_UPLOAD, MIN_SYNC_INTERVAL), MAX_SYNC_INTERVAL)
+
+
+def get_suppressed_count(subscription_ids: Optional[List[int]] = None) -> int:
+    """
+    Counts the synchronization requests which were dropped because one was already queued or running.
+    """
+    states = SubscriptionSyncState.objects.all()
+    if subscription_ids is not None:
+        states = states.filter(subscription_id__in=subscription_ids)
+    return states.aggregate(total=Sum('suppressed_count'))['total'] or 0
+
+
+def __acquire(subscription_ids: Iterable[int]) -> List[int]:
+    subscription_ids = list(subscription_ids)
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=SYNC_LOCK_TIMEOUT)
+    token = uuid.uuid4().hex
+
+    SubscriptionSyncState.objects.bulk_create(
+        [SubscriptionSyncState(subscription_id=sub_id) for sub_id in subscription_ids],
+        ignore_conflicts=True)
+
+    # The token tells which rows this request managed to lock
+    states = SubscriptionSyncState.objects.filter(subscription_id__in=subscription_ids)
+    states \
+        .filter(Q(queued_at__isnull=True) | Q(queued_at__lt=stale)) \
+        .filter(Q(started_at__isnull=True) | Q(started_at__lt=stale)) \
+        .update(queued_at=now, started_at=None, token=token)
+
+    states.exclude(token=token).update(suppressed_count=F('suppressed_count') + 1)
+    return list(states.filter(token=token).values_list('subscription_id', flat=True))
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import requests
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from YtManagerApp.management import http_client, result_cache
+
+if TYPE_CHECKING:
+    from django.db.models.fields.files import ImageFieldFile
+
+# Number of thumbnails downloaded and resized in parallel by each process; Pillow releases the GIL while resizing
+# and encoding, so the resizing runs in the same threads
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 30
+
+# Formats of the resized variants, which are generated when a thumbnail is stored
+VARIANT_FORMATS = {
+    'jpg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+log = logging.getLogger('thumbnails')
+
+__executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='thumbnails')
+
+
+def fetch_thumbnail(field: 'ImageFieldFile', url: str, url_field: str = 'thumbnail') -> Optional[Future]:
+    """
+    Downloads a thumbnail in the background, and stores it in the given image field once done.
+
+    Files are stored under the hash of their content, so identical images are only stored once. Nothing is
+    downloaded if the image was already fetched from the same URL.
+    :param field: Image field of a model instance which will reference the thumbnail
+    :param url: Thumbnail URL
+    :param url_field: Name of the model field which remembers the URL the thumbnail was loaded from
+    :return: Future which completes when the thumbnail is stored, or None if there is nothing to download
+    """
+    instance = field.instance
+
+    if getattr(instance, url_field) == url and field and field.storage.exists(field.name):
+        log.debug('Thumbnail %s is already stored as %s', url, field.name)
+        return None
+
+    # Unsaved instances can't be updated from the background, so these are handled right away
+    if instance.pk is None:
+        name = __download(field, url)
+        if name is not None:
+            __resize(field.storage.path(name), variant_size(field))
+            field.name = name
+            setattr(instance, url_field, url)
+        return None
+
+    return __executor.submit(__download_and_update, field, url, url_field)
+
+
+def __download_and_update(field: 'ImageFieldFile', url: str, url_field: str):
+    try:
+        name = __download(field, url)
+        if name is not None:
+            __resize(field.storage.path(name), variant_size(field))
+            instance = field.instance
+            type(instance).objects.filter(pk=instance.pk).update(**{field.field.name: name, url_field: url})
+            __invalidate_cached_results(instance)
+    except Exception as e:
+        log.exception('Error while storing thumbnail %s: %s', url, e)
+    finally:
+        close_old_connections()
+
+
+def __invalidate_cached_results(instance):
+    # Thumbnails are shown in the video lists and subscription tree cached for the owner of the subscription
+    user_id = getattr(instance, 'user_id', None)
+    if user_id is None and hasattr(instance, 'subscription'):
+        user_id = instance.subscription.user_id
+    if user_id is not None:
+        result_cache.invalidate(user_id)
+
+
+def __download(field: 'ImageFieldFile', url: str) -> Optional[str]:
+    try:
+        response = http_client.get_session().get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        log.error('Error while downloading stream for thumbnail %s. Error: %s', url, e)
+        return None
+
+    content_type = response.headers.get('Content-Type', '').split(';')[0]
+    ext = mimetypes.guess_extension(content_type) or ''
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    name = os.path.join(field.field.upload_to, content_hash[:2], content_hash + ext)
+
+    if field.storage.exists(name):
+        log.debug('Thumbnail %s is identical to the stored file %s', url, name)
+        return name
+
+    return field.storage.save(name, ContentFile(response.content))
+
+
+def variant_size(field: 'ImageFieldFile') -> Tuple[int, int]:
+    """
+    Gets the size of the resized variant for an image field, depending on the model it belongs to.
+    """
+    if field.instance._meta.model_name == 'subscription':
+        return settings.THUMBNAIL_SIZE_SUBSCRIPTION
+    return settings.THUMBNAIL_SIZE_VIDEO
+
+
+def variant_name(name: str, size: Tuple[int, int], fmt: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f'{root}_{size[0]}x{size[1]}.{fmt}'
+
+
+def variant_url(field: 'ImageFieldFile', fmt: str = 'jpg') -> Optional[str]:
+    """
+    Gets the URL of the resized variant of a thumbnail. Falls back to the original image if the variant
+    hasn't been generated.
+    :param field: Image field
+    :param fmt: Variant format, one of VARIANT_FORMATS
+    :return: URL, or None if there is no thumbnail
+    """
+    if not field:
+        return None
+
+    name = variant_name(field.name, variant_size(field), fmt)
+    if field.storage.exists(name):
+        return field.storage.url(name)
+    return field.url
+
+
+def generate_variants(path: str, size: Tuple[int, int]):
+    """
+    Generates the resized variants of an image, next to the original file. Existing variants are kept, which is
+    safe since the file names are derived from the content hash of the original.
+    :param path: Path of the original image
+    :param size: Bounding box of the resized variants
+    """
+    pending = {fmt: variant_name(path, size, fmt) for fmt in VARIANT_FORMATS}
+    pending = {fmt: variant_path for fmt, variant_path in pending.items() if not os.path.exists(variant_path)}
+    if len(pending) == 0:
+        return
+
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        for fmt, variant_path in pending.items():
+            image.save(variant_path, VARIANT_FORMATS[fmt], quality=85)
+
+
+def __resize(path: str, size: Tuple[int, int]):
+    try:
+        generate_variants(path, size)
+    except Exception as e:
+        log.error('Error while resizing thumbnail %s. Error: %s', path, e)
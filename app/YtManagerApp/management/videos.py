@@ -1,9 +1,15 @@
-import re
-from typing import Optional
+import base64
+import datetime
+import json
+import random
+from typing import Optional, List, Tuple
 
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import connection
+from django.db.models import Q, QuerySet, Count, Sum, F, Window
+from django.db.models.functions import RowNumber
 
+from YtManagerApp.management import search, result_cache, sync_scheduler
 from YtManagerApp.models import Subscription, Video, SubscriptionFolder
 
 
@@ -16,21 +22,10 @@ def get_videos(user: User,
                only_downloaded: Optional[bool] = None,
                ):
 
-    filter_args = []
     filter_kwargs = {
         'subscription__user': user
     }
 
-    # Process query string - basically, we break it down into words,
-    # and then search for the given text in the name, description, uploader name and subscription name
-    if query is not None:
-        for match in re.finditer(r'\w+', query):
-            word = match[0]
-            filter_args.append(Q(name__icontains=word)
-                               | Q(description__icontains=word)
-                               | Q(uploader_name__icontains=word)
-                               | Q(subscription__name__icontains=word))
-
     # Subscription id
     if subscription_id is not None:
         filter_kwargs['subscription_id'] = subscription_id
@@ -54,4 +49,193 @@ def get_videos(user: User,
     if only_downloaded is not None:
         filter_kwargs['downloaded_path__isnull'] = not only_downloaded
 
-    return Video.objects.filter(*filter_args, **filter_kwargs).order_by(sort_order)
+    videos = Video.objects.filter(**filter_kwargs)
+
+    # Process query string - the words are looked up in the name, description, uploader name and subscription name.
+    # Without a sort order, the results are sorted by relevance.
+    if query:
+        videos = search.search_videos(videos, query, ranked=sort_order is None)
+        if sort_order is None:
+            return videos
+
+    return videos.order_by(sort_order or '-publish_date')
+
+
+def get_videos_page(videos: QuerySet,
+                    sort_order: Optional[str],
+                    count: int,
+                    cursor: Optional[str] = None) -> Tuple[List[Video], Optional[str]]:
+    """
+    Gets a page of videos, using keyset pagination: the cursor remembers the sort key and ID of the last video on
+    the previous page, so the next page is fetched by seeking the index instead of skipping rows with OFFSET.
+    Results sorted by relevance have no usable key, so for these the cursor holds an offset.
+    :param videos: Video queryset, as returned by get_videos
+    :param sort_order: Sort order used for get_videos; a field name, with '-' prefix if descending
+    :param count: Number of videos on a page
+    :param cursor: Cursor of the page, as returned for the previous page; None for the first page
+    :return: Tuple containing the videos on the page, and the cursor of the next page, or None if this is the last
+    """
+    position = __decode_cursor(cursor) if cursor else None
+    if position is not None and not (isinstance(position, int) if sort_order is None
+                                     else isinstance(position, list) and len(position) == 2):
+        raise ValueError('Invalid cursor')
+
+    if sort_order is None:
+        offset = position or 0
+        page = list(videos[offset:offset + count + 1])
+        next_position = offset + count
+    else:
+        field = sort_order.lstrip('-')
+        descending = sort_order.startswith('-')
+        videos = videos.order_by(sort_order, '-id' if descending else 'id')
+
+        if position is not None:
+            value, last_id = position
+            lookup = 'lt' if descending else 'gt'
+            videos = videos.filter(Q(**{f'{field}__{lookup}': value})
+                                   | Q(**{field: value, f'id__{lookup}': last_id}))
+
+        page = list(videos[:count + 1])
+        next_position = [getattr(page[count - 1], field), page[count - 1].id] if len(page) > count else None
+
+    if len(page) <= count:
+        return page, None
+    return page[:count], __encode_cursor(next_position)
+
+
+def get_videos_totals(user: User, videos: QuerySet) -> Tuple[int, int]:
+    """
+    Counts the videos in the result set, and their total duration. The result is cached until the user's videos
+    change.
+    :param user: User owning the videos
+    :param videos: Video queryset, as returned by get_videos
+    :return: Tuple containing the number of videos, and their total duration in seconds
+    """
+    def compute():
+        result = videos.aggregate(count=Count('id'), duration=Sum('duration'))
+        return result['count'], result['duration'] or 0
+
+    return result_cache.get_or_compute(user.id, 'totals', {'query': str(videos.query)}, compute)
+
+
+def mark_videos_watched(user: User, video_ids: List[int], watched: bool = True) -> int:
+    """
+    Marks several videos as watched or not watched at once. The state changes with a single update; the files of
+    newly watched videos are deleted by one background job, if the subscription says so; and each affected
+    subscription is synchronized once.
+    :param user: User owning the videos; other users' videos are ignored
+    :param video_ids: IDs of the videos
+    :param watched: New state
+    :return: Number of videos which changed state
+    """
+    from YtManagerApp import tasks
+    from YtManagerApp.management.appconfig import appconfig
+
+    changed = Video.bulk_set_watched(Video.objects.filter(id__in=video_ids, subscription__user=user), watched)
+    if len(changed) == 0:
+        return 0
+
+    subscriptions = Subscription.objects.select_related('user').in_bulk({video.subscription_id for video in changed})
+
+    to_delete = []
+    if watched:
+        to_delete = [video for video in changed
+                     if video.downloaded_path is not None
+                     and appconfig.for_sub(subscriptions[video.subscription_id], 'automatically_delete_watched')]
+
+    if len(to_delete) > 0:
+        # the deletion job requests the synchronization of these subscriptions once it's done
+        tasks.delete_video_files.delay([video.id for video in to_delete])
+        for video in to_delete:
+            subscriptions.pop(video.subscription_id, None)
+
+    sync_scheduler.request_sync(subscriptions.values())
+    return len(changed)
+
+
+# Number of unwatched videos per subscription considered when building a shuffled playlist
+SHUFFLE_CANDIDATES_PER_SUBSCRIPTION = 20
+# Maximum number of videos in a shuffled playlist, since videos with an unknown duration always fit
+SHUFFLE_MAX_VIDEOS = 100
+
+
+def get_shuffle_playlist(user: User,
+                         subscription_id: Optional[int] = None,
+                         folder_id: Optional[int] = None,
+                         target_duration: int = 60 * 60) -> List[Video]:
+    """
+    Builds a playlist of unwatched videos lasting up to the target duration. The oldest unwatched video comes
+    first; then the subscriptions are visited in random order, each adding its oldest remaining video as long as it
+    fits, until no subscription can add anything.
+
+    The candidates are loaded with a single query, and the playlist is put together in memory.
+    :param user: User requesting the playlist; only their videos are considered
+    :param subscription_id: Only use the videos of this subscription
+    :param folder_id: Only use the videos of the subscriptions in this folder, including sub-folders
+    :param target_duration: Length of the playlist, in seconds
+    :return: List of videos, only having the id, subscription_id, duration and publish_date fields loaded
+    """
+    videos = get_videos(user, None, subscription_id=subscription_id, folder_id=folder_id, only_watched=False)
+    candidates = __get_oldest_per_subscription(videos, SHUFFLE_CANDIDATES_PER_SUBSCRIPTION)
+    if len(candidates) == 0:
+        return []
+
+    queues = {}
+    for video in candidates:
+        queues.setdefault(video.subscription_id, []).append(video)
+    for queue in queues.values():
+        queue.reverse()
+
+    first = min(candidates, key=lambda v: (v.publish_date, v.id))
+    queues[first.subscription_id].remove(first)
+    playlist = [first]
+    time_remaining = target_duration - first.duration
+
+    subscription_order = list(queues.keys())
+    random.shuffle(subscription_order)
+
+    added_video = True
+    while added_video and len(playlist) < SHUFFLE_MAX_VIDEOS:
+        added_video = False
+        for sub_id in subscription_order:
+            queue = queues[sub_id]
+            if len(queue) > 0 and queue[-1].duration <= time_remaining and len(playlist) < SHUFFLE_MAX_VIDEOS:
+                video = queue.pop()
+                time_remaining -= video.duration
+                playlist.append(video)
+                added_video = True
+
+    return playlist
+
+
+def __get_oldest_per_subscription(videos: QuerySet, count: int) -> List[Video]:
+    videos = videos.order_by().only('id', 'subscription_id', 'duration', 'publish_date')
+
+    if not connection.features.supports_over_clause:
+        return list(videos.order_by('publish_date', 'id'))
+
+    ranked = videos \
+        .annotate(shuffle_rank=Window(RowNumber(),
+                                  partition_by=[F('subscription_id')],
+                                  order_by=[F('publish_date').asc(), F('id').asc()])) \
+        .values('id', 'subscription_id', 'duration', 'publish_date', 'shuffle_rank')
+    sql, params = ranked.query.sql_with_params()
+
+    return list(Video.objects.raw(f'SELECT * FROM ({sql}) ranked WHERE shuffle_rank <= %s ORDER BY publish_date, id',
+                                  (*params, count)))
+
+
+def __encode_cursor(position) -> str:
+    def default(value):
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        raise TypeError(f'Cannot encode {type(value)} in a cursor')
+
+    return base64.urlsafe_b64encode(json.dumps(position, default=default).encode()).decode()
+
+
+def __decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as e:
+        raise ValueError('Invalid cursor') from e
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+def mark_complete_videos(apps, schema_editor):
+    video_model = apps.get_model('YtManagerApp', 'Video')
+    video_model.objects.exclude(duration=0).update(needs_sync=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0017_feedcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='needs_sync',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.RunPython(mark_complete_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:18
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_videos(apps, schema_editor):
+    subscription_model = apps.get_model('YtManagerApp', 'Subscription')
+    counts = subscription_model.objects.annotate(
+        actual_video_count=Count('video'),
+        actual_unwatched_count=Count('video', filter=Q(video__watched=False)),
+        actual_downloaded_count=Count('video', filter=Q(video__downloaded_path__isnull=False)))
+    for sub in counts:
+        subscription_model.objects.filter(pk=sub.pk).update(
+            video_count=sub.actual_video_count,
+            unwatched_count=sub.actual_unwatched_count,
+            downloaded_count=sub.actual_downloaded_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0018_video_needs_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='downloaded_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='unwatched_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='video_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_videos, migrations.RunPython.noop),
+    ]
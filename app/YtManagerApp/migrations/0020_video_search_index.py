@@ -0,0 +1,130 @@
+from django.db import migrations, OperationalError
+
+# The statements are copied from management.search as it was when this migration was written, so that later changes
+# to the search module don't change what this migration does.
+
+# SQLite: FTS5 table holding a copy of the searchable text, with rowid = video id
+SQLITE_INSTALL = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS "YtManagerApp_video_fts"
+        USING fts5(name, description, uploader_name, subscription_name, tokenize = 'unicode61 remove_diacritics 2')''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_insert" AFTER INSERT ON "YtManagerApp_video" BEGIN
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_update"
+        AFTER UPDATE OF name, description, uploader_name, subscription_id ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_delete" AFTER DELETE ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_subscription_update"
+        AFTER UPDATE OF name ON "YtManagerApp_subscription" BEGIN
+            UPDATE "YtManagerApp_video_fts" SET subscription_name = new.name
+            WHERE rowid IN (SELECT id FROM "YtManagerApp_video" WHERE subscription_id = new.id);
+        END''',
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_insert"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_update"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_delete"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_subscription_update"',
+    'DROP TABLE IF EXISTS "YtManagerApp_video_fts"',
+]
+
+SQLITE_REBUILD = [
+    'DELETE FROM "YtManagerApp_video_fts"',
+    '''INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+        SELECT v.id, v.name, v.description, v.uploader_name, s.name
+        FROM "YtManagerApp_video" v INNER JOIN "YtManagerApp_subscription" s ON s.id = v.subscription_id''',
+]
+
+# PostgreSQL: weighted tsvector column on the video table, maintained by a trigger, with a GIN index
+POSTGRES_INSTALL = [
+    'ALTER TABLE "YtManagerApp_video" ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE INDEX IF NOT EXISTS "YtManagerApp_video_search_idx" ON "YtManagerApp_video" USING GIN (search_vector)',
+    '''CREATE OR REPLACE FUNCTION ytmanagerapp_video_search_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.uploader_name, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(
+                    (SELECT name FROM "YtManagerApp_subscription" WHERE id = NEW.subscription_id), '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'D');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    'DROP TRIGGER IF EXISTS ytmanagerapp_video_search ON "YtManagerApp_video"',
+    '''CREATE TRIGGER ytmanagerapp_video_search
+        BEFORE INSERT OR UPDATE OF name, description, uploader_name, subscription_id ON "YtManagerApp_video"
+        FOR EACH ROW EXECUTE PROCEDURE ytmanagerapp_video_search_update()''',
+    '''CREATE OR REPLACE FUNCTION ytmanagerapp_subscription_search_update() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.name IS DISTINCT FROM OLD.name THEN
+                UPDATE "YtManagerApp_video" SET name = name WHERE subscription_id = NEW.id;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    'DROP TRIGGER IF EXISTS ytmanagerapp_subscription_search ON "YtManagerApp_subscription"',
+    '''CREATE TRIGGER ytmanagerapp_subscription_search
+        AFTER UPDATE OF name ON "YtManagerApp_subscription"
+        FOR EACH ROW EXECUTE PROCEDURE ytmanagerapp_subscription_search_update()''',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS ytmanagerapp_subscription_search ON "YtManagerApp_subscription"',
+    'DROP FUNCTION IF EXISTS ytmanagerapp_subscription_search_update()',
+    'DROP TRIGGER IF EXISTS ytmanagerapp_video_search ON "YtManagerApp_video"',
+    'DROP FUNCTION IF EXISTS ytmanagerapp_video_search_update()',
+    'ALTER TABLE "YtManagerApp_video" DROP COLUMN IF EXISTS search_vector',
+]
+
+POSTGRES_REBUILD = [
+    # the trigger recomputes the vector
+    'UPDATE "YtManagerApp_video" SET name = name',
+]
+
+
+def install_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            execute(connection, SQLITE_INSTALL)
+        except OperationalError:
+            # SQLite may be built without FTS5; searches fall back to substring matching
+            return
+        execute(connection, SQLITE_REBUILD)
+    elif connection.vendor == 'postgresql':
+        execute(connection, POSTGRES_INSTALL)
+        execute(connection, POSTGRES_REBUILD)
+
+
+def uninstall_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        execute(connection, SQLITE_UNINSTALL)
+    elif connection.vendor == 'postgresql':
+        execute(connection, POSTGRES_UNINSTALL)
+
+
+def execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0019_subscription_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
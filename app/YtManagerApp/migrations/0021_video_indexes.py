@@ -0,0 +1,141 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:21
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+# SQLite rebuilds the video table to add the constraint, and the full text search triggers would still point to the old
+# table. The triggers are dropped before and created again after; the full text table itself is kept. The statements
+# are copied from 0020_video_search_index, so that later changes to management.search don't change this migration.
+SQLITE_DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_insert"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_update"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_delete"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_subscription_update"',
+]
+
+SQLITE_CREATE_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_insert" AFTER INSERT ON "YtManagerApp_video" BEGIN
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_update"
+        AFTER UPDATE OF name, description, uploader_name, subscription_id ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_delete" AFTER DELETE ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_subscription_update"
+        AFTER UPDATE OF name ON "YtManagerApp_subscription" BEGIN
+            UPDATE "YtManagerApp_video_fts" SET subscription_name = new.name
+            WHERE rowid IN (SELECT id FROM "YtManagerApp_video" WHERE subscription_id = new.id);
+        END''',
+    # videos deleted while the triggers were missing
+    'DELETE FROM "YtManagerApp_video_fts" WHERE rowid NOT IN (SELECT id FROM "YtManagerApp_video")',
+]
+
+
+def remove_duplicate_videos(apps, schema_editor):
+    """
+    Removes the duplicate (subscription, video_id) rows before the unique constraint is added. The copy that was
+    downloaded, or else watched, or else the oldest one is kept.
+    """
+    video_model = apps.get_model('YtManagerApp', 'Video')
+    subscription_model = apps.get_model('YtManagerApp', 'Subscription')
+
+    duplicates = video_model.objects \
+        .values('subscription_id', 'video_id') \
+        .annotate(copies=Count('id')) \
+        .filter(copies__gt=1)
+
+    affected_subscriptions = set()
+    for duplicate in duplicates:
+        copies = list(video_model.objects
+                      .filter(subscription_id=duplicate['subscription_id'], video_id=duplicate['video_id'])
+                      .order_by('id'))
+        keep = max(copies, key=lambda v: (v.downloaded_path is not None, v.watched, -v.id))
+        video_model.objects.filter(id__in=[v.id for v in copies if v.id != keep.id]).delete()
+        affected_subscriptions.add(duplicate['subscription_id'])
+
+    # the materialized counters of the affected subscriptions are now wrong
+    counts = subscription_model.objects.filter(id__in=affected_subscriptions).annotate(
+        actual_video_count=Count('video'),
+        actual_unwatched_count=Count('video', filter=Q(video__watched=False)),
+        actual_downloaded_count=Count('video', filter=Q(video__downloaded_path__isnull=False)))
+    for sub in counts:
+        subscription_model.objects.filter(pk=sub.pk).update(
+            video_count=sub.actual_video_count,
+            unwatched_count=sub.actual_unwatched_count,
+            downloaded_count=sub.actual_downloaded_count)
+
+
+def drop_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        execute(connection, SQLITE_DROP_TRIGGERS)
+
+
+def create_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    # PostgreSQL doesn't rebuild tables, and SQLite may be built without FTS5
+    if connection.vendor == 'sqlite' and 'YtManagerApp_video_fts' in connection.introspection.table_names():
+        execute(connection, SQLITE_CREATE_TRIGGERS)
+
+
+def execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0020_video_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.RunPython(remove_duplicate_videos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['subscription', 'watched'], name='video_sub_watched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['subscription', 'publish_date'], name='video_sub_publish_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['subscription', 'playlist_index'], name='video_sub_playlist_index_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['subscription', 'views'], name='video_sub_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['subscription', 'rating'], name='video_sub_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['publish_date'], name='video_publish_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('downloaded_path__isnull', True)), fields=['subscription', 'watched'], name='video_sub_not_downloaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('downloaded_path__isnull', False)), fields=['subscription'], name='video_sub_downloaded_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='video',
+            constraint=models.UniqueConstraint(fields=('subscription', 'video_id'), name='video_unique_subscription_video_id'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
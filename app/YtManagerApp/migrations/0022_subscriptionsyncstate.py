@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0021_video_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionSyncState',
+            fields=[
+                ('subscription', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync_state', serialize=False, to='YtManagerApp.subscription')),
+                ('queued_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('token', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('suppressed_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0022_subscriptionsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriptionsyncstate',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
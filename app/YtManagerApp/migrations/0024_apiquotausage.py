@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0023_subscriptionsyncstate_next_sync_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiQuotaUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('provider', models.CharField(max_length=64)),
+                ('endpoint', models.CharField(max_length=64)),
+                ('calls', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('deferred', models.IntegerField(default=0)),
+                ('subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='YtManagerApp.subscription')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='apiquotausage',
+            index=models.Index(fields=['day', 'provider', 'endpoint', 'subscription'], name='quota_usage_day_idx'),
+        ),
+    ]
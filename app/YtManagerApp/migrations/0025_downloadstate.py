@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0024_apiquotausage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadState',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='download_state', serialize=False, to='YtManagerApp.video')),
+                ('status', models.CharField(choices=[('downloading', 'Downloading'), ('queued', 'Queued'), ('retrying', 'Waiting to retry'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='queued', max_length=16)),
+                ('attempts', models.IntegerField(default=0)),
+                ('partial_path', models.CharField(blank=True, max_length=1024)),
+                ('downloaded_bytes', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('history', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+    ]
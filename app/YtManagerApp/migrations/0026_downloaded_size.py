@@ -0,0 +1,80 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+# SQLite rebuilds the video and subscription tables to add the fields, and the full text search triggers would still
+# point to the old tables. The triggers are dropped before and created again after; the full text table itself is
+# kept. The statements are copied from 0020_video_search_index, so that later changes to management.search don't
+# change this migration.
+SQLITE_DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_insert"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_update"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_delete"',
+    'DROP TRIGGER IF EXISTS "YtManagerApp_video_fts_subscription_update"',
+]
+
+SQLITE_CREATE_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_insert" AFTER INSERT ON "YtManagerApp_video" BEGIN
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_update"
+        AFTER UPDATE OF name, description, uploader_name, subscription_id ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+            INSERT INTO "YtManagerApp_video_fts" (rowid, name, description, uploader_name, subscription_name)
+            SELECT new.id, new.name, new.description, new.uploader_name, s.name
+            FROM "YtManagerApp_subscription" s WHERE s.id = new.subscription_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_delete" AFTER DELETE ON "YtManagerApp_video" BEGIN
+            DELETE FROM "YtManagerApp_video_fts" WHERE rowid = old.id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS "YtManagerApp_video_fts_subscription_update"
+        AFTER UPDATE OF name ON "YtManagerApp_subscription" BEGIN
+            UPDATE "YtManagerApp_video_fts" SET subscription_name = new.name
+            WHERE rowid IN (SELECT id FROM "YtManagerApp_video" WHERE subscription_id = new.id);
+        END''',
+    # videos deleted while the triggers were missing
+    'DELETE FROM "YtManagerApp_video_fts" WHERE rowid NOT IN (SELECT id FROM "YtManagerApp_video")',
+]
+
+
+def drop_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        execute(connection, SQLITE_DROP_TRIGGERS)
+
+
+def create_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    # PostgreSQL doesn't rebuild tables, and SQLite may be built without FTS5
+    if connection.vendor == 'sqlite' and 'YtManagerApp_video_fts' in connection.introspection.table_names():
+        execute(connection, SQLITE_CREATE_TRIGGERS)
+
+
+def execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0025_downloadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='subscription',
+            name='downloaded_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='downloaded_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
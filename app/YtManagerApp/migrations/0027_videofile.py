@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0026_downloaded_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField()),
+                ('size', models.BigIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(blank=True, null=True)),
+                ('mime', models.CharField(blank=True, max_length=127)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='YtManagerApp.video')),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+import bisect
+import os
+
+from django.db import migrations
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def measure_downloaded_videos(apps, schema_editor):
+    """
+    Records the size of the videos downloaded before sizes were recorded, so that the download planner doesn't have
+    to measure them. Each download directory is listed once; videos whose files are missing keep a size of 0.
+    """
+    video_model = apps.get_model('YtManagerApp', 'Video')
+    subscription_model = apps.get_model('YtManagerApp', 'Subscription')
+
+    videos_by_directory = {}
+    for video_id, subscription_id, downloaded_path in video_model.objects \
+            .filter(downloaded_path__isnull=False, downloaded_size=0) \
+            .exclude(downloaded_path='') \
+            .values_list('id', 'subscription_id', 'downloaded_path') \
+            .iterator():
+        directory, file_pattern = os.path.split(downloaded_path)
+        videos_by_directory.setdefault(directory, []).append((video_id, subscription_id, file_pattern))
+
+    affected_subscriptions = set()
+    for directory, videos in videos_by_directory.items():
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+
+        for video_id, subscription_id, file_pattern in videos:
+            # Names starting with the pattern are next to each other once sorted
+            size = 0
+            i = bisect.bisect_left(names, file_pattern)
+            while i < len(names) and names[i].startswith(file_pattern):
+                try:
+                    size += os.path.getsize(os.path.join(directory, names[i]))
+                except OSError:
+                    pass
+                i += 1
+
+            if size > 0:
+                video_model.objects.filter(id=video_id).update(downloaded_size=size)
+                affected_subscriptions.add(subscription_id)
+
+    # the materialized counters of the affected subscriptions are now wrong
+    sizes = subscription_model.objects.filter(id__in=affected_subscriptions).annotate(
+        actual_downloaded_size=Coalesce(
+            Sum('video__downloaded_size', filter=Q(video__downloaded_path__isnull=False)), 0))
+    for sub in sizes:
+        subscription_model.objects.filter(pk=sub.pk).update(downloaded_size=sub.actual_downloaded_size)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0027_videofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(measure_downloaded_videos, migrations.RunPython.noop),
+    ]
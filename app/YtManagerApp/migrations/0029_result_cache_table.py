@@ -0,0 +1,24 @@
+from django.core.management import call_command
+from django.db import migrations
+
+# Table of the database cache used when no CacheUrl is configured; must match CACHES in settings
+CACHE_TABLE = 'ytsm_result_cache'
+
+
+def create_cache_table(apps, schema_editor):
+    call_command('createcachetable', CACHE_TABLE, database=schema_editor.connection.alias, verbosity=0)
+
+
+def drop_cache_table(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {schema_editor.quote_name(CACHE_TABLE)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0028_backfill_downloaded_size'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, drop_cache_table),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YtManagerApp', '0029_result_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadSlot',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('token', models.CharField(blank=True, max_length=32)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,13 +1,14 @@
+import hashlib
 import logging
-import mimetypes
 
 import importlib
 import os
 import datetime
-from typing import Callable, Union, Any, Optional, TYPE_CHECKING
+from typing import Callable, Union, Any, Optional, List, TYPE_CHECKING
 
-from django.db import models
-from django.db.models.functions import Lower
+from django.db import models, transaction
+from django.db.models import F, Q, Count, Sum
+from django.db.models.functions import Lower, Coalesce
 from django.contrib.auth.models import User
 from django.conf import settings
 
@@ -15,6 +16,8 @@ from django.conf import settings
 # verbose_name = user shown name
 # null = nullable, blank = user is allowed to set value to empty
 
+from YtManagerApp.management import result_cache
+
 if TYPE_CHECKING:
     from YtManagerApp.IProvider import IProvider
 
@@ -56,6 +59,14 @@ class SubscriptionFolder(models.Model):
     def __repr__(self):
         return f'folder {self.id}, name="{self.name}"'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        result_cache.invalidate(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        result_cache.invalidate(self.user_id)
+        return super().delete(*args, **kwargs)
+
     def get_unwatched_count(self):
         def count(node: Union["SubscriptionFolder", "Subscription"]):
             if node.pk != self.pk:
@@ -86,13 +97,22 @@ class SubscriptionFolder(models.Model):
             if data is not None:
                 data_collected.append(data)
 
+        # Load the user's whole tree at once, and walk it in memory
+        child_folders = {}
+        for folder in SubscriptionFolder.objects.filter(user=user).order_by(Lower('name')):
+            child_folders.setdefault(folder.parent_id, []).append(folder)
+
+        child_subscriptions = {}
+        for subscription in Subscription.objects.filter(user=user).order_by(Lower('name')):
+            child_subscriptions.setdefault(subscription.parent_folder_id, []).append(subscription)
+
         # Visit root
         if root_folder_id is not None:
             root_folder = SubscriptionFolder.objects.get(id=root_folder_id)
             collect(visit_func(root_folder))
 
         queue = [root_folder_id]
-        visited = []
+        visited = set()
 
         while len(queue) > 0:
             folder_id = queue.pop()
@@ -100,13 +120,13 @@ class SubscriptionFolder(models.Model):
             if folder_id in visited:
                 logging.error('Found folder tree cycle for folder id %d.', folder_id)
                 continue
-            visited.append(folder_id)
+            visited.add(folder_id)
 
-            for folder in SubscriptionFolder.objects.filter(parent_id=folder_id, user=user).order_by(Lower('name')):
+            for folder in child_folders.get(folder_id, []):
                 collect(visit_func(folder))
                 queue.append(folder.id)
 
-            for subscription in Subscription.objects.filter(parent_folder_id=folder_id, user=user).order_by(Lower('name')):
+            for subscription in child_subscriptions.get(folder_id, []):
                 collect(visit_func(subscription))
 
         return data_collected
@@ -136,12 +156,31 @@ class Subscription(models.Model):
         choices=VIDEO_ORDER_CHOICES)
     automatically_delete_watched = models.BooleanField(null=True, blank=True)
 
+    # materialized counters, maintained by Video.save() and Video.delete()
+    video_count = models.IntegerField(default=0)
+    unwatched_count = models.IntegerField(default=0)
+    downloaded_count = models.IntegerField(default=0)
+    downloaded_size = models.BigIntegerField(default=0)
+
     def __str__(self):
         return self.name
 
     def __repr__(self):
         return f'subscription {self.id}, name="{self.name}", playlist_id="{self.playlist_id}"'
 
+    # fields which aren't shown in the cached video lists and subscription tree
+    __UNCACHED_FIELDS = ('last_synchronised',)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or not all(field in self.__UNCACHED_FIELDS for field in update_fields):
+            result_cache.invalidate(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        result_cache.invalidate(self.user_id)
+        return super().delete(*args, **kwargs)
+
     def delete_subscription(self, keep_downloaded_videos: bool):
         self.delete()
 
@@ -149,7 +188,62 @@ class Subscription(models.Model):
         self.get_provider().synchronise_channel(self)
 
     def get_unwatched_count(self):
-        return Video.objects.filter(subscription=self, watched=False).count()
+        return self.unwatched_count
+
+    @staticmethod
+    def adjust_counters(subscription_id: int, videos: int = 0, unwatched: int = 0, downloaded: int = 0,
+                        downloaded_size: int = 0):
+        """
+        Adds the given amounts to the video counters of a subscription. Should be called in the same
+        transaction as the change to the videos.
+        """
+        if videos == 0 and unwatched == 0 and downloaded == 0 and downloaded_size == 0:
+            return
+        Subscription.objects.filter(pk=subscription_id).update(
+            video_count=F('video_count') + videos,
+            unwatched_count=F('unwatched_count') + unwatched,
+            downloaded_count=F('downloaded_count') + downloaded,
+            downloaded_size=F('downloaded_size') + downloaded_size)
+
+        # the user's cached video lists are now stale
+        for user_id in Subscription.objects.filter(pk=subscription_id).values_list('user_id', flat=True):
+            result_cache.invalidate(user_id)
+
+    @staticmethod
+    def recount_counters(subscriptions: Optional[models.QuerySet] = None) -> int:
+        """
+        Recomputes the video counters from the videos table.
+        :param subscriptions: Subscriptions to recount, all if not specified
+        :return: Number of subscriptions whose counters were wrong
+        """
+        if subscriptions is None:
+            subscriptions = Subscription.objects.all()
+
+        counts = subscriptions.annotate(
+            actual_video_count=Count('video'),
+            actual_unwatched_count=Count('video', filter=Q(video__watched=False)),
+            actual_downloaded_count=Count('video', filter=Q(video__downloaded_path__isnull=False)),
+            actual_downloaded_size=Coalesce(
+                Sum('video__downloaded_size', filter=Q(video__downloaded_path__isnull=False)), 0))
+
+        fixed = 0
+        for sub in counts:
+            if (sub.video_count, sub.unwatched_count, sub.downloaded_count, sub.downloaded_size) != \
+                    (sub.actual_video_count, sub.actual_unwatched_count, sub.actual_downloaded_count,
+                     sub.actual_downloaded_size):
+                Subscription.objects.filter(pk=sub.pk).update(
+                    video_count=sub.actual_video_count,
+                    unwatched_count=sub.actual_unwatched_count,
+                    downloaded_count=sub.actual_downloaded_count,
+                    downloaded_size=sub.actual_downloaded_size)
+                result_cache.invalidate(sub.user_id)
+                fixed += 1
+
+        return fixed
+
+    @staticmethod
+    def get_downloaded_count_for_user(user: User) -> int:
+        return Subscription.objects.filter(user=user).aggregate(total=models.Sum('downloaded_count'))['total'] or 0
 
     def get_provider(self) -> 'IProvider':
         if self.provider not in settings.INSTALLED_PROVIDERS:
@@ -173,27 +267,159 @@ class Video(models.Model):
     views = models.IntegerField(default=0)
     rating = models.FloatField(default=0.5)
     duration = models.IntegerField(default=0)
+    # bytes used on disk by the downloaded files; 0 if not downloaded or not measured yet
+    downloaded_size = models.BigIntegerField(default=0)
+    # set while the video still has metadata (statistics, thumbnail) to be fetched by the provider
+    needs_sync = models.BooleanField(default=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            # providers look videos up by (subscription, video_id) when synchronizing
+            models.UniqueConstraint(fields=['subscription', 'video_id'], name='video_unique_subscription_video_id'),
+        ]
+        indexes = [
+            # unwatched counts, shuffle
+            models.Index(fields=['subscription', 'watched'], name='video_sub_watched_idx'),
+            # sort orders in VIDEO_ORDER_MAPPING, within a subscription and across all of them
+            models.Index(fields=['subscription', 'publish_date'], name='video_sub_publish_date_idx'),
+            models.Index(fields=['subscription', 'playlist_index'], name='video_sub_playlist_index_idx'),
+            models.Index(fields=['subscription', 'views'], name='video_sub_views_idx'),
+            models.Index(fields=['subscription', 'rating'], name='video_sub_rating_idx'),
+            models.Index(fields=['publish_date'], name='video_publish_date_idx'),
+            # download candidates, and downloaded videos
+            models.Index(fields=['subscription', 'watched'], name='video_sub_not_downloaded_idx',
+                         condition=Q(downloaded_path__isnull=True)),
+            models.Index(fields=['subscription'], name='video_sub_downloaded_idx',
+                         condition=Q(downloaded_path__isnull=False)),
+        ]
+
+    # fields which determine how a video is counted in the subscription's counters
+    __COUNTED_FIELDS = ('subscription', 'subscription_id', 'watched', 'downloaded_path', 'downloaded_size')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.__remember_counted_state()
+        return instance
+
+    def __remember_counted_state(self):
+        deferred = self.get_deferred_fields()
+        if any(field in deferred for field in self.__COUNTED_FIELDS):
+            self._counted_state = None
+        else:
+            self._counted_state = self.__counted_state()
+
+    def __counted_state(self):
+        downloaded = self.downloaded_path is not None
+        return self.subscription_id, not self.watched, downloaded, self.downloaded_size if downloaded else 0
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not any(field in update_fields for field in self.__COUNTED_FIELDS):
+            return super().save(*args, **kwargs)
+
+        if self.downloaded_path is None and self.downloaded_size != 0:
+            self.downloaded_size = 0
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['downloaded_size']
+
+        with transaction.atomic():
+            adding = self._state.adding
+            old_state = getattr(self, '_counted_state', None)
+            super().save(*args, **kwargs)
+            new_state = self.__counted_state()
+
+            if adding:
+                Subscription.adjust_counters(new_state[0], 1, int(new_state[1]), int(new_state[2]), new_state[3])
+            elif old_state is None:
+                # we don't know what was there before, so the counters are recomputed
+                Subscription.recount_counters(Subscription.objects.filter(pk=self.subscription_id))
+            elif old_state != new_state:
+                Subscription.adjust_counters(old_state[0], -1, -int(old_state[1]), -int(old_state[2]), -old_state[3])
+                Subscription.adjust_counters(new_state[0], 1, int(new_state[1]), int(new_state[2]), new_state[3])
+
+            self._counted_state = new_state
+
+    @staticmethod
+    def bulk_create_counted(videos: List['Video'], batch_size: Optional[int] = None):
+        """
+        Inserts new videos in bulk, and updates the subscription counters in the same transaction. Videos which
+        already exist (e.g. inserted by an overlapping synchronization) are skipped.
+        """
+        if len(videos) == 0:
+            return
+
+        with transaction.atomic():
+            Video.objects.bulk_create(videos, batch_size=batch_size, ignore_conflicts=True)
+
+            # The database doesn't tell which rows were skipped, so the counters of the affected subscriptions are
+            # recomputed from the rows which are actually there
+            subscription_ids = {video.subscription_id for video in videos}
+            Subscription.recount_counters(Subscription.objects.filter(pk__in=subscription_ids))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            state = getattr(self, '_counted_state', None) or self.__counted_state()
+            result = super().delete(*args, **kwargs)
+            Subscription.adjust_counters(state[0], -1, -int(state[1]), -int(state[2]), -state[3])
+            self._counted_state = None
+        return result
+
+    @staticmethod
+    def bulk_set_watched(videos: models.QuerySet, watched: bool) -> List['Video']:
+        """
+        Marks videos as watched or not watched with a single update, and updates the subscription counters in the
+        same transaction.
+        :param videos: Videos to change
+        :param watched: New state
+        :return: The videos which changed state, with only id, subscription and downloaded_path loaded
+        """
+        with transaction.atomic():
+            changed = list(videos.filter(watched=not watched).only('id', 'subscription_id', 'downloaded_path'))
+            Video.objects.filter(id__in=[video.id for video in changed]).update(watched=watched)
+
+            deltas = {}
+            for video in changed:
+                deltas[video.subscription_id] = deltas.get(video.subscription_id, 0) + 1
+            for sub_id, count in deltas.items():
+                Subscription.adjust_counters(sub_id, unwatched=-count if watched else count)
+
+        return changed
 
     def mark_watched(self):
+        from YtManagerApp.management.videos import mark_videos_watched
+        mark_videos_watched(self.subscription.user, [self.id], True)
         self.watched = True
-        self.save()
-        if self.downloaded_path is not None:
-            from YtManagerApp.management.appconfig import appconfig
-            if appconfig.for_sub(self.subscription, 'automatically_delete_watched'):
-                self.delete()
-        self.subscription.get_provider().synchronise_channel(self.subscription)
+        self.__remember_counted_state()
 
     def mark_unwatched(self):
+        from YtManagerApp.management.videos import mark_videos_watched
+        mark_videos_watched(self.subscription.user, [self.id], False)
         self.watched = False
-        self.save()
-        self.subscription.get_provider().synchronise_channel(self.subscription)
+        self.__remember_counted_state()
+
+    def get_registered_files(self) -> List['VideoFile']:
+        """
+        Gets the downloaded files from the file registry. Videos downloaded before the registry existed have their
+        files registered on first use.
+        """
+        if not self.downloaded_path:
+            return []
+        files = list(self.files.all())
+        if len(files) == 0:
+            from YtManagerApp.management import file_registry
+            files = file_registry.register(self)
+        return files
 
     def get_files(self):
-        if self.downloaded_path is not None:
-            directory, file_pattern = os.path.split(self.downloaded_path)
-            for file in os.listdir(directory):
-                if file.startswith(file_pattern):
-                    yield os.path.join(directory, file)
+        for file in self.get_registered_files():
+            yield file.path
+
+    def measure_files(self) -> int:
+        """
+        Sums up the size of the downloaded files, in bytes.
+        """
+        return sum(file.size for file in self.get_registered_files())
 
     def find_video(self):
         """
@@ -201,14 +427,13 @@ class Video(models.Model):
         returns
         :return: Tuple containing file path and mime type
         """
-        for file in self.get_files():
-            mime, _ = mimetypes.guess_type(file)
-            if mime is not None and mime.startswith('video/'):
-                return file, mime
+        for file in self.get_registered_files():
+            if file.mime.startswith('video/'):
+                return file.path, file.mime
 
         return None, None
 
-    def delete_files(self):
+    def delete_files(self, synchronize: bool = True):
         try:
             for file in self.get_files():
                 logging.info('Deleting files for video %s: %s', self.video_id, file)
@@ -218,9 +443,12 @@ class Video(models.Model):
                     logging.warning("Tried to delete non-existant file %s for video %s", file, self.video_id)
         except FileNotFoundError:
             logging.warning("Tried to fetch non-existant file listing for video %s", self.video_id)
+        self.files.all().delete()
         self.downloaded_path = None
         self.save()
-        self.subscription.get_provider().synchronise_channel(self.subscription)
+        if synchronize:
+            from YtManagerApp.management import sync_scheduler
+            sync_scheduler.request_sync([self.subscription])
 
     def download(self):
         if not self.downloaded_path:
@@ -237,6 +465,251 @@ class Video(models.Model):
         return str(datetime.timedelta(seconds=self.duration))
 
 
+DOWNLOAD_STATUS_CHOICES = [
+    ('downloading', 'Downloading'),
+    ('queued', 'Queued'),
+    ('retrying', 'Waiting to retry'),
+    ('completed', 'Completed'),
+    ('failed', 'Failed'),
+]
+
+
+class DownloadState(models.Model):
+    """
+    Progress of a video download, so that downloads interrupted by a worker restart can be found and resumed from
+    their partial file.
+    """
+    # downloads whose worker didn't send a heartbeat for this long are considered interrupted
+    STALE_AFTER = datetime.timedelta(minutes=15)
+    # progress is written to the database at most this often
+    PROGRESS_INTERVAL = datetime.timedelta(seconds=10)
+    # queued downloads which didn't start for this long are considered lost
+    PENDING_EXPIRY = datetime.timedelta(days=1)
+
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='download_state')
+    status = models.CharField(max_length=16, choices=DOWNLOAD_STATUS_CHOICES, default='queued', db_index=True)
+    attempts = models.IntegerField(default=0)
+    partial_path = models.CharField(max_length=1024, blank=True)
+    downloaded_bytes = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    # one entry per attempt, with its start and end time, bytes downloaded and error
+    history = models.JSONField(default=list, blank=True)
+
+    def __repr__(self):
+        return f'download of video {self.video_id}: {self.status}, {self.downloaded_bytes}/{self.total_bytes} bytes'
+
+    @staticmethod
+    def queue(video: Video) -> 'DownloadState':
+        """
+        Records a download waiting for a free slot in the worker's download pool.
+        """
+        state, _ = DownloadState.objects.get_or_create(video=video)
+        state.status = 'queued'
+        state.updated_at = datetime.datetime.now(datetime.timezone.utc)
+        state.save()
+        return state
+
+    def start(self):
+        """
+        Records the start of a download attempt, once the download pool runs it.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.status = 'downloading'
+        self.attempts += 1
+        self.started_at = now
+        self.updated_at = now
+        self.save()
+
+    def record_progress(self, progress: dict):
+        """
+        youtube-dl progress hook. Writes the size of the partial file to the database, at most every
+        PROGRESS_INTERVAL, so that the download can be continued if it is interrupted.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if progress['status'] == 'downloading' and now - self.updated_at < DownloadState.PROGRESS_INTERVAL:
+            return
+
+        self.partial_path = progress.get('tmpfilename') or progress.get('filename') or ''
+        self.downloaded_bytes = progress.get('downloaded_bytes') or 0
+        self.total_bytes = progress.get('total_bytes') or progress.get('total_bytes_estimate')
+        self.updated_at = now
+        DownloadState.objects.filter(pk=self.pk).update(partial_path=self.partial_path,
+                                                        downloaded_bytes=self.downloaded_bytes,
+                                                        total_bytes=self.total_bytes,
+                                                        updated_at=now)
+
+    def heartbeat(self):
+        """
+        Called periodically by the download pool while the download runs, so that it is not mistaken for an
+        interrupted one while youtube-dl doesn't report progress, e.g. while merging formats or on a stalled transfer.
+        """
+        DownloadState.objects.filter(pk=self.pk, status='downloading') \
+            .update(updated_at=datetime.datetime.now(datetime.timezone.utc))
+
+    def finish(self, status: str, error: str = ''):
+        """
+        Records the outcome of the current attempt.
+        :param status: 'completed', 'retrying' or 'failed'
+        :param error: Error message, if the attempt failed
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.history = self.history + [{
+            'started': self.started_at.isoformat() if self.started_at is not None else None,
+            'finished': now.isoformat(),
+            'downloaded_bytes': self.downloaded_bytes,
+            'error': error,
+        }]
+        self.status = status
+        self.updated_at = now
+        if status == 'completed':
+            self.partial_path = ''
+        self.save()
+
+    @staticmethod
+    def get_pending() -> models.QuerySet:
+        """
+        Gets the downloads which are queued or in progress. Downloads which were not heard of for a day are assumed
+        lost, e.g. with a task queue which was reset.
+        """
+        expired = datetime.datetime.now(datetime.timezone.utc) - DownloadState.PENDING_EXPIRY
+        return DownloadState.objects.filter(status__in=('queued', 'downloading', 'retrying'), updated_at__gte=expired)
+
+    @staticmethod
+    def get_interrupted() -> models.QuerySet:
+        """
+        Gets the downloads whose worker stopped sending heartbeats, usually because it was restarted.
+        """
+        stale = datetime.datetime.now(datetime.timezone.utc) - DownloadState.STALE_AFTER
+        return DownloadState.objects.filter(status='downloading', updated_at__lt=stale)
+
+
+class DownloadSlot(models.Model):
+    """
+    Slot taken by a running download, shared by all the workers so that the download limits hold across processes.
+    There are DOWNLOAD_CONCURRENCY slots named 'all/<n>', and DOWNLOAD_CONCURRENCY_PER_HOST named '<host>/<n>' for
+    each site (see management.download_executor).
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    # token of the download holding the slot; empty if the slot is free
+    token = models.CharField(max_length=32, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __repr__(self):
+        return f'download slot {self.name}: {self.token or "free"}'
+
+
+class VideoFile(models.Model):
+    """
+    File downloaded for a video, as last seen on disk. Files are registered when a download completes, and the
+    registry is reconciled with the download directories periodically (see management.file_registry).
+    """
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='files')
+    path = models.TextField()
+    size = models.BigIntegerField(default=0)
+    modified_at = models.DateTimeField(null=True, blank=True)
+    mime = models.CharField(max_length=127, blank=True)
+
+    def __repr__(self):
+        return f'file {self.path} of video {self.video_id}: {self.size} bytes, {self.mime}'
+
+
+class SubscriptionSyncState(models.Model):
+    """
+    Tracks the queued or running synchronization of a subscription, so that duplicate requests can be dropped.
+    """
+    subscription = models.OneToOneField(Subscription, on_delete=models.CASCADE, primary_key=True,
+                                        related_name='sync_state')
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # identifies the request which holds the lock
+    token = models.CharField(max_length=32, blank=True, db_index=True)
+    suppressed_count = models.IntegerField(default=0)
+    # when the periodic synchronization should visit the subscription next, learned from its upload history
+    next_sync_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+
+class FeedCache(models.Model):
+    """
+    Remembers the last processed version of a subscription's feed, so that unchanged feeds can be skipped.
+    """
+    subscription = models.OneToOneField(Subscription, on_delete=models.CASCADE, related_name='feed_cache')
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+    last_checked = models.DateTimeField(null=True, blank=True)
+
+    def __repr__(self):
+        return f'feed cache for subscription {self.subscription_id}, hits={self.hits}, misses={self.misses}'
+
+    def request_headers(self) -> dict:
+        """
+        Builds the conditional request headers for the next feed download.
+        :return: Dictionary of HTTP headers
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def is_modified(self, response) -> bool:
+        """
+        Checks if a feed response differs from the last processed version.
+        :param response: HTTP response, which must have been successful
+        :return: False if the server answered 304 or the content is identical, True otherwise
+        """
+        if response.status_code == 304:
+            return False
+        return hashlib.sha256(response.content).hexdigest() != self.content_hash
+
+    def record_hit(self):
+        self.hits = models.F('hits') + 1
+        self.last_checked = datetime.datetime.now(datetime.timezone.utc)
+        self.save(update_fields=['hits', 'last_checked'])
+        self.refresh_from_db(fields=['hits'])
+
+    def record_miss(self, response):
+        """
+        Stores the validators of a feed response once it has been processed successfully.
+        :param response: HTTP response
+        """
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.content_hash = hashlib.sha256(response.content).hexdigest()
+        self.misses = models.F('misses') + 1
+        self.last_checked = datetime.datetime.now(datetime.timezone.utc)
+        self.save()
+        self.refresh_from_db(fields=['misses'])
+
+
+class ApiQuotaUsage(models.Model):
+    """
+    Units of API quota spent on a day, per endpoint and subscription. Calls which are not made on behalf of a
+    subscription (e.g. adding a new one) have no subscription.
+    """
+    day = models.DateField()
+    provider = models.CharField(max_length=64)
+    endpoint = models.CharField(max_length=64)
+    subscription = models.ForeignKey(Subscription, on_delete=models.SET_NULL, null=True, blank=True)
+    calls = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    # calls which were not made because the daily budget was running out
+    deferred = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'provider', 'endpoint', 'subscription'], name='quota_usage_day_idx'),
+        ]
+
+    def __repr__(self):
+        return f'{self.provider} {self.endpoint} quota usage on {self.day}: {self.units} units in {self.calls} calls'
+
+
 JOB_STATES = [
     ('running', 0),
     ('finished', 1),
@@ -1,9 +1,13 @@
 # Create your tasks here
 from __future__ import absolute_import, unicode_literals
 
+from typing import List
+
 from celery import shared_task
+from celery.signals import worker_ready
 from django.db.models import F
 
+from YtManagerApp.management import sync_scheduler, file_registry
 from YtManagerApp.models import *
 
 log = logging.getLogger(__name__)
@@ -12,16 +16,103 @@ providers = {}
 
 
 @shared_task
-def synchronize_all():
+def synchronize_all(force: bool = False):
+    """
+    Synchronizes the subscriptions which are due, according to their upload frequency.
+    :param force: Synchronize all subscriptions, even if they are not due
+    """
     log.info("Starting synchronize all")
-    channels = Subscription.objects.all().order_by(F('last_synchronised').desc(nulls_first=True))
-    for channel in channels:
-        channel.get_provider().synchronise_channel(channel)
+    subscriptions = Subscription.objects.all() if force else sync_scheduler.get_due_subscriptions()
+    queued = sync_scheduler.request_sync(subscriptions, debounce=False)
+    log.info("Queued the synchronization of %d subscriptions", len(queued))
+
+
+@shared_task
+def run_queued_syncs(subscription_ids: List[int]):
+    """
+    Synchronizes subscriptions queued by the sync scheduler.
+    """
+    sync_scheduler.start(subscription_ids)
+    try:
+        channels = list(Subscription.objects
+                        .filter(id__in=subscription_ids)
+                        .order_by(F('last_synchronised').desc(nulls_first=True)))
+    except Exception:
+        sync_scheduler.release(subscription_ids)
+        raise
+
+    synchronize_subscriptions(channels)
+
+
+def synchronize_subscriptions(subscriptions):
+    """
+    Synchronizes the given subscriptions. Each provider gets all of its subscriptions at once, so it can batch the
+    work. The locks of subscriptions whose provider fails to start the synchronization are released.
+    """
+    channels_by_provider = {}
+    for channel in subscriptions:
+        channels_by_provider.setdefault(channel.provider, []).append(channel)
+
+    failed = []
+    for provider, provider_channels in channels_by_provider.items():
+        try:
+            provider_channels[0].get_provider().synchronise_channels(provider_channels)
+        except Exception as e:
+            log.exception("Failed to start the synchronization of %d %s subscriptions: %s",
+                          len(provider_channels), provider, e)
+            sync_scheduler.release(channel.id for channel in provider_channels)
+            failed.append(e)
+
+    if len(failed) > 0:
+        raise failed[0]
 
 
 @shared_task()
 def synchronize_folder(folder_id: int):
     log.info("Starting sync folder")
     subscriptions = Subscription.objects.filter(parent_folder_id=folder_id)
-    for subscription in subscriptions:
-        subscription.get_provider().synchronise_channel(subscription)
+    sync_scheduler.request_sync(subscriptions, debounce=False)
+
+
+@shared_task
+def delete_video_files(video_ids: List[int]):
+    """
+    Deletes the downloaded files of several videos, then synchronizes each affected subscription once.
+    """
+    videos = Video.objects.filter(id__in=video_ids, downloaded_path__isnull=False).select_related('subscription')
+    subscriptions = {}
+    for video in videos:
+        video.delete_files(synchronize=False)
+        subscriptions[video.subscription_id] = video.subscription
+
+    log.info("Deleted files of %d videos", len(videos))
+    sync_scheduler.request_sync(subscriptions.values())
+
+
+@shared_task
+def resume_interrupted_downloads():
+    """
+    Queues again the downloads which were interrupted, e.g. by a worker restart. Their partial files are continued.
+    """
+    interrupted = DownloadState.get_interrupted()
+    # Marked as queued one at a time, so that other workers starting at the same time don't queue them again
+    video_ids = [video_id for video_id in interrupted.values_list('video_id', flat=True)
+                 if interrupted.filter(video_id=video_id).update(status='queued') > 0]
+
+    for video in Video.objects.filter(id__in=video_ids).select_related('subscription'):
+        log.info('Resuming interrupted download of video %d [%s %s]', video.id, video.video_id, video.name)
+        video.subscription.get_provider().download_video(video)
+
+
+@shared_task
+def reconcile_video_files():
+    """
+    Updates the registry of downloaded files with the changes made to the download directories, e.g. videos deleted
+    or added by hand.
+    """
+    file_registry.reconcile()
+
+
+@worker_ready.connect
+def __resume_downloads_on_startup(**kwargs):
+    resume_interrupted_downloads.delay()
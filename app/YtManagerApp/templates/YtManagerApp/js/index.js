@@ -161,7 +161,7 @@ let videos_timeout = null;
 function videos_ResetPageAndReloadWithTimer()
 {
     let filters_form = $("#form_video_filter");
-    filters_form.find('input[name=page]').val("1");
+    filters_form.find('input[name=cursor]').val("");
 
     clearTimeout(videos_timeout);
     videos_timeout = setTimeout(function()
@@ -171,18 +171,55 @@ function videos_ResetPageAndReloadWithTimer()
     }, 200);
 }
 
-function videos_PageClicked()
+let videos_loadingMore = false;
+let videos_moreObserver = null;
+
+function videos_LoadMore()
 {
-    // Obtain page from button
-    let page = $(this).data('navigation-page');
+    let more = $(".videos-more");
+    if (videos_loadingMore || more.length === 0)
+        return;
 
-    // Set page
+    // Request the next page, using the cursor returned with the previous one
     let filters_form = $("#form_video_filter");
-    filters_form.find('input[name=page]').val(page);
+    let cursorField = filters_form.find('input[name=cursor]');
+    cursorField.val(more.data('cursor'));
+    let data = filters_form.serialize();
+    cursorField.val("");
 
-    // Reload
-    videos_Reload();
-    $("html, body").animate({ scrollTop: 0 }, "slow");
+    videos_loadingMore = true;
+    more.find('.btn-videos-more').prop('disabled', true);
+
+    $.post(filters_form.attr('action'), data)
+        .done(function(result) {
+            more.replaceWith(result);
+            videos_BindPage();
+        })
+        .fail(function() {
+            more.find('.btn-videos-more').prop('disabled', false);
+        })
+        .always(function() {
+            videos_loadingMore = false;
+        });
+}
+
+function videos_BindPage()
+{
+    $("#videos-wrapper .ajax-link").off("click").on("click", ajaxLink_Clicked);
+    $(".btn-videos-more").off("click").on("click", videos_LoadMore);
+
+    // Infinite scroll: load the next page when the 'load more' button comes into view
+    if (videos_moreObserver !== null)
+        videos_moreObserver.disconnect();
+
+    let more = $(".videos-more");
+    if (more.length > 0 && 'IntersectionObserver' in window) {
+        videos_moreObserver = new IntersectionObserver(function(entries) {
+            if (entries.some(entry => entry.isIntersecting))
+                videos_LoadMore();
+        });
+        videos_moreObserver.observe(more[0]);
+    }
 }
 
 function videos_Submit(e)
@@ -196,8 +233,7 @@ function videos_Submit(e)
     $.post(url, form.serialize())
         .done(function(result) {
             $("#videos-wrapper").html(result);
-            $(".ajax-link").on("click", ajaxLink_Clicked);
-            $(".btn-paging").on("click", videos_PageClicked);
+            videos_BindPage();
         })
         .fail(function() {
             $("#videos-wrapper").html('<div class="alert alert-danger">An error occurred while retrieving the video list!</div>');
@@ -0,0 +1,13 @@
+from django import template
+
+from YtManagerApp.management import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_variant(field, fmt='jpg'):
+    """
+    {{ video.thumb|thumbnail_variant:'webp' }}
+    """
+    return thumbnails.variant_url(field, fmt) or ''
@@ -1 +1,468 @@
-# Create your tests here.
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from YtManagerApp import tasks
+from YtManagerApp.management import search, downloader, sync_scheduler
+from YtManagerApp.management.videos import get_videos, get_videos_page
+from YtManagerApp.models import Subscription, Video, VIDEO_ORDER_MAPPING, SubscriptionSyncState
+
+MB = 1024 * 1024
+
+
+def create_subscription(user: User, name: str = 'Test') -> Subscription:
+    return Subscription.objects.create(
+        name=name, playlist_id=f'PL{name}', description='', channel_id=f'UC{name}', channel_name=name,
+        thumbnail='', user=user, provider='Youtube')
+
+
+class VideoQueryPlanTests(TestCase):
+    """
+    Checks that the hot queries on the videos table are answered from an index, instead of scanning the table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscription = Subscription.objects.create(
+            name='Test', playlist_id='PL', description='', channel_id='UC', channel_name='Test',
+            thumbnail='', user=cls.user, provider='Youtube')
+
+        publish_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Video.bulk_create_counted([
+            Video(video_id=f'video{i}', name=f'Video {i}', description='', subscription=cls.subscription,
+                  playlist_index=i, publish_date=publish_date + datetime.timedelta(days=i), thumbnail='')
+            for i in range(100)
+        ])
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # the tables are too small for the planner to prefer an index on its own
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f'Query plans are not checked on {connection.vendor}')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = Video._meta.db_table
+
+        if connection.vendor == 'sqlite':
+            steps = [line for line in plan.splitlines() if f' {table} ' in f'{line} ']
+            self.assertTrue(steps, plan)
+            for step in steps:
+                self.assertIn('USING', step, plan)
+        else:
+            self.assertNotIn(f'Seq Scan on "{table}"', plan)
+
+    def test_get_videos(self):
+        for sort_order in VIDEO_ORDER_MAPPING.values():
+            with self.subTest(sort_order=sort_order):
+                self.assertUsesIndex(get_videos(self.user, sort_order, subscription_id=self.subscription.id,
+                                                only_watched=False))
+
+    def test_download_candidates(self):
+        self.assertUsesIndex(Video.objects
+                             .filter(subscription=self.subscription, downloaded_path__isnull=True, watched=False)
+                             .order_by(VIDEO_ORDER_MAPPING['newest']))
+
+    def test_synchronize_known_videos(self):
+        self.assertUsesIndex(Video.objects
+                             .filter(subscription=self.subscription, video_id__in=['video1', 'video2'])
+                             .values_list('video_id', flat=True))
+
+    def test_unwatched_videos(self):
+        self.assertUsesIndex(Video.objects.filter(subscription=self.subscription, watched=False))
+
+    def test_videos_needing_sync(self):
+        self.assertUsesIndex(Video.objects.filter(subscription_id=self.subscription.id, needs_sync=True)
+                             .only('id', 'video_id', 'thumbnail'))
+
+
+class SearchFallbackTests(TestCase):
+    """
+    Checks that results sorted by relevance keep a stable order when there is no rank to sort by.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscription = Subscription.objects.create(
+            name='Test', playlist_id='PL', description='', channel_id='UC', channel_name='Test',
+            thumbnail='', user=cls.user, provider='Youtube')
+
+        # pairs of videos published at the same time, so that only the ID tells them apart
+        publish_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Video.bulk_create_counted([
+            Video(video_id=f'video{i}', name=f'Video {i}', description='', subscription=cls.subscription,
+                  playlist_index=i, publish_date=publish_date + datetime.timedelta(days=i // 2), thumbnail='')
+            for i in range(10)
+        ])
+        cls.expected = list(Video.objects.order_by('-publish_date', '-id').values_list('id', flat=True))
+
+    def test_substring_fallback(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            videos = search.search_videos(Video.objects.all(), 'video', ranked=True)
+        self.assertTrue(videos.ordered)
+        self.assertEqual(list(videos.values_list('id', flat=True)), self.expected)
+
+    def test_query_without_words(self):
+        videos = search.search_videos(Video.objects.all(), '?!', ranked=True)
+        self.assertTrue(videos.ordered)
+        self.assertEqual(list(videos.values_list('id', flat=True)), self.expected)
+
+    def test_pages_by_relevance(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            videos = get_videos(self.user, None, query='video')
+            ids, cursor = [], None
+            while True:
+                page, cursor = get_videos_page(videos, None, 3, cursor)
+                ids.extend(video.id for video in page)
+                if cursor is None:
+                    break
+        self.assertEqual(ids, self.expected)
+
+
+class VideoPagingTests(TestCase):
+    """
+    Checks the keyset pagination of the video lists: every video is listed once, in order, whatever the page size,
+    including videos which share a sort key.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscription = create_subscription(cls.user)
+
+        # videos published 3 at a time, so that pages end in the middle of a group
+        publish_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Video.bulk_create_counted([
+            Video(video_id=f'video{i}', name=f'Video {i % 4}', description='', subscription=cls.subscription,
+                  playlist_index=i, publish_date=publish_date + datetime.timedelta(days=i // 3), thumbnail='')
+            for i in range(20)
+        ])
+
+    def get_all_pages(self, sort_order, count):
+        videos = get_videos(self.user, sort_order)
+        ids, cursor, pages = [], None, 0
+        while True:
+            page, cursor = get_videos_page(videos, sort_order, count, cursor)
+            ids.extend(video.id for video in page)
+            pages += 1
+            if cursor is None:
+                return ids, pages
+
+    def test_pages(self):
+        for sort_order in ('-publish_date', 'publish_date', 'name', '-name'):
+            descending = sort_order.startswith('-')
+            expected = list(Video.objects
+                            .order_by(sort_order, '-id' if descending else 'id')
+                            .values_list('id', flat=True))
+            for count in (1, 3, 4, 7, 20, 50):
+                with self.subTest(sort_order=sort_order, count=count):
+                    ids, pages = self.get_all_pages(sort_order, count)
+                    self.assertEqual(ids, expected)
+                    self.assertEqual(pages, max((len(expected) + count - 1) // count, 1))
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = get_videos_page(get_videos(self.user, '-publish_date'), '-publish_date', 20)
+        self.assertEqual(len(page), 20)
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor(self):
+        videos = get_videos(self.user, '-publish_date')
+        _, cursor = get_videos_page(videos, '-publish_date', 5)
+        _, offset_cursor = get_videos_page(get_videos(self.user, None), None, 5)
+
+        for sort_order, bad_cursor in (('-publish_date', 'not a cursor!'),
+                                       ('-publish_date', offset_cursor),
+                                       (None, cursor)):
+            with self.subTest(sort_order=sort_order, cursor=bad_cursor):
+                with self.assertRaises(ValueError):
+                    get_videos_page(get_videos(self.user, sort_order), sort_order, 5, bad_cursor)
+
+
+@override_settings(VIDEO_SERVE_MODE='django')
+class VideoRangeTests(TestCase):
+    """
+    Checks the byte ranges served by the video file view.
+    """
+    CONTENT = bytes(range(100))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscription = create_subscription(cls.user)
+        cls.video = Video.objects.create(video_id='video', name='Video', description='', subscription=cls.subscription,
+                                         playlist_index=0, publish_date=timezone.now(), thumbnail='')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with open(os.path.join(self.directory, 'video.mp4'), 'wb') as f:
+            f.write(self.CONTENT)
+
+        self.video.downloaded_path = os.path.join(self.directory, 'video')
+        self.video.save()
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(reverse('video-src', args=[self.video.id]), **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_whole_file(self):
+        response, content = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_ranges(self):
+        for header, first, last in (('bytes=10-19', 10, 19),
+                                    ('bytes=90-', 90, 99),
+                                    ('bytes=-5', 95, 99),
+                                    ('bytes=-500', 0, 99),
+                                    ('bytes=95-1000', 95, 99)):
+            with self.subTest(header=header):
+                response, content = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(content, self.CONTENT[first:last + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/100')
+                self.assertEqual(response['Content-Length'], str(last - first + 1))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=100-', 'bytes=500-600', 'bytes=-0'):
+            with self.subTest(header=header):
+                response, _ = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_ignored_range(self):
+        # malformed or multiple ranges are answered with the whole file
+        for header in ('bytes=20-10', 'bytes=0-1,5-6', 'items=0-5', 'bytes=-'):
+            with self.subTest(header=header):
+                response, content = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(content, self.CONTENT)
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+
+        response, content = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.CONTENT[:10])
+
+        response, content = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.CONTENT)
+
+    def test_other_users_video(self):
+        self.client.force_login(User.objects.create_user('other'))
+        response, _ = self.get()
+        self.assertEqual(response.status_code, 404)
+
+
+class DownloadPlanTests(TestCase):
+    """
+    Checks the global limits of the download planner, and the eviction of watched videos to make room.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.user.preferences['auto_download'] = True
+        cls.user.preferences['automatically_delete_watched'] = True
+        cls.user.preferences['download_global_limit'] = 0
+        cls.user.preferences['download_subscription_limit'] = 0
+        cls.user.preferences['download_global_size_limit'] = 1000
+
+        cls.watched = create_subscription(cls.user, 'Watched')
+        cls.unwatched = create_subscription(cls.user, 'Unwatched')
+        publish_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+        # 3 watched videos of 10 MB, and a downloaded video of 870 MB: 900 MB used, videos estimated at 870 MB
+        for i in range(3):
+            Video.objects.create(video_id=f'watched{i}', name='Watched', description='', subscription=cls.watched,
+                                 playlist_index=i, publish_date=publish_date + datetime.timedelta(days=i),
+                                 thumbnail='', watched=True, downloaded_path=f'/downloads/watched{i}',
+                                 downloaded_size=10 * MB)
+        Video.objects.create(video_id='big', name='Big', description='', subscription=cls.unwatched,
+                             playlist_index=0, publish_date=publish_date, thumbnail='',
+                             downloaded_path='/downloads/big', downloaded_size=870 * MB)
+        cls.candidate = Video.objects.create(video_id='new', name='New', description='', subscription=cls.unwatched,
+                                             playlist_index=1, publish_date=publish_date, thumbnail='')
+
+    def plan(self, size_limit):
+        self.user.preferences['download_global_size_limit'] = size_limit
+        return downloader.plan_downloads(self.user)
+
+    def test_room_left(self):
+        plan = self.plan(2000)
+        self.assertEqual([video.id for video in plan.downloads], [self.candidate.id])
+        self.assertEqual(plan.evictions, [])
+
+    def test_evicts_oldest_watched_videos(self):
+        # 900 + 870 MB: 2 watched videos must go to get under 1755 MB
+        plan = self.plan(1755)
+        self.assertEqual([video.id for video in plan.downloads], [self.candidate.id])
+        self.assertEqual([video.video_id for video in plan.evictions], ['watched0', 'watched1'])
+        self.assertEqual(plan.expected_size, 1750 * MB)
+
+    def test_nothing_evicted_without_enough_room(self):
+        # even without the 30 MB of watched videos, 840 + 870 MB is over the limit
+        plan = self.plan(1000)
+        self.assertEqual(plan.downloads, [])
+        self.assertEqual(plan.evictions, [])
+
+
+@override_settings(SYNC_DEBOUNCE_SECONDS=30)
+class SyncSchedulerTests(TestCase):
+    """
+    Checks that synchronization requests are coalesced per subscription, and how often subscriptions are planned.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscriptions = [create_subscription(cls.user, f'Sub{i}') for i in range(3)]
+
+    def setUp(self):
+        patcher = mock.patch.object(tasks.run_queued_syncs, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_are_coalesced(self):
+        queued = sync_scheduler.request_sync(self.subscriptions[:2])
+        self.assertEqual(len(queued), 2)
+        self.apply_async.assert_called_once()
+        self.assertEqual(self.apply_async.call_args.kwargs['countdown'], 30)
+
+        queued = sync_scheduler.request_sync(self.subscriptions, debounce=False)
+        self.assertEqual(queued, [self.subscriptions[2]])
+        self.assertEqual(self.apply_async.call_args.kwargs['countdown'], 0)
+        self.assertEqual(sync_scheduler.get_suppressed_count(), 2)
+
+    def test_finish_releases_the_lock(self):
+        sub = self.subscriptions[0]
+        sync_scheduler.request_sync([sub])
+        sync_scheduler.start([sub.id])
+        sync_scheduler.finish(sub.id)
+
+        self.assertGreater(SubscriptionSyncState.objects.get(subscription=sub).next_sync_at, timezone.now())
+        self.assertEqual(sync_scheduler.request_sync([sub]), [sub])
+
+    def test_stale_lock_is_taken_over(self):
+        sub = self.subscriptions[0]
+        sync_scheduler.request_sync([sub])
+        sync_scheduler.start([sub.id])
+
+        long_ago = timezone.now() - datetime.timedelta(seconds=sync_scheduler.SYNC_LOCK_TIMEOUT + 60)
+        SubscriptionSyncState.objects.filter(subscription=sub).update(queued_at=long_ago, started_at=long_ago)
+        sync_scheduler.refresh([sub.id])
+        self.assertEqual(sync_scheduler.request_sync([sub]), [])
+
+        SubscriptionSyncState.objects.filter(subscription=sub).update(queued_at=long_ago, started_at=long_ago)
+        self.assertEqual(sync_scheduler.request_sync([sub]), [sub])
+
+    def test_lock_released_when_enqueueing_fails(self):
+        self.apply_async.side_effect = ConnectionError('broker down')
+        with self.assertRaises(ConnectionError):
+            sync_scheduler.request_sync(self.subscriptions)
+
+        self.apply_async.side_effect = None
+        self.assertEqual(len(sync_scheduler.request_sync(self.subscriptions)), 3)
+
+    def test_due_subscriptions(self):
+        planned, due, new = self.subscriptions
+        hour = datetime.timedelta(hours=1)
+        SubscriptionSyncState.objects.create(subscription=planned, next_sync_at=timezone.now() + hour)
+        SubscriptionSyncState.objects.create(subscription=due, next_sync_at=timezone.now() - hour)
+
+        self.assertEqual(set(sync_scheduler.get_due_subscriptions()), {due, new})
+
+    def test_sync_interval(self):
+        sub = self.subscriptions[0]
+        self.assertEqual(sync_scheduler.get_sync_interval(sub.id), sync_scheduler.DEFAULT_SYNC_INTERVAL)
+
+        def upload_every(gap: datetime.timedelta, last_upload: datetime.datetime):
+            Video.objects.filter(subscription=sub).delete()
+            Video.bulk_create_counted([
+                Video(video_id=f'video{i}', name='Video', description='', subscription=sub, playlist_index=i,
+                      publish_date=last_upload - gap * i, thumbnail='')
+                for i in range(5)
+            ])
+            return sync_scheduler.get_sync_interval(sub.id)
+
+        now = timezone.now()
+        # daily uploads, the last one just now: checked every 6 hours
+        interval = upload_every(datetime.timedelta(days=1), now)
+        self.assertAlmostEqual(interval.total_seconds(), datetime.timedelta(hours=6).total_seconds(), delta=60)
+        # within the bounds
+        self.assertEqual(upload_every(datetime.timedelta(minutes=10), now), sync_scheduler.MIN_SYNC_INTERVAL)
+        self.assertEqual(upload_every(datetime.timedelta(days=60), now), sync_scheduler.MAX_SYNC_INTERVAL)
+        # daily uploads, but nothing for 8 days: checked every 2 days
+        interval = upload_every(datetime.timedelta(days=1), now - datetime.timedelta(days=8))
+        self.assertAlmostEqual(interval.total_seconds(), datetime.timedelta(days=2).total_seconds(), delta=60)
+
+
+class SubscriptionCounterTests(TestCase):
+    """
+    Checks that the materialized video counters of subscriptions follow the changes made to the videos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test')
+        cls.subscription = create_subscription(cls.user)
+        publish_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Video.bulk_create_counted([
+            Video(video_id=f'video{i}', name='Video', description='', subscription=cls.subscription,
+                  playlist_index=i, publish_date=publish_date, thumbnail='')
+            for i in range(5)
+        ])
+
+    def assertCounters(self, video_count, unwatched_count, downloaded_count, downloaded_size):
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.video_count, self.subscription.unwatched_count,
+                          self.subscription.downloaded_count, self.subscription.downloaded_size),
+                         (video_count, unwatched_count, downloaded_count, downloaded_size))
+
+        # the same as recomputing them
+        Subscription.recount_counters(Subscription.objects.filter(pk=self.subscription.pk))
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.video_count, self.subscription.unwatched_count,
+                          self.subscription.downloaded_count, self.subscription.downloaded_size),
+                         (video_count, unwatched_count, downloaded_count, downloaded_size))
+
+    def test_counters(self):
+        self.assertCounters(5, 5, 0, 0)
+
+        video = Video.objects.filter(subscription=self.subscription).first()
+        video.watched = True
+        video.downloaded_path = '/downloads/video'
+        video.downloaded_size = 100
+        video.save()
+        self.assertCounters(5, 4, 1, 100)
+
+        video.downloaded_path = None
+        video.save()
+        self.assertCounters(5, 4, 0, 0)
+
+        video.delete()
+        self.assertCounters(4, 4, 0, 0)
+
+        # videos inserted twice are only counted once
+        Video.bulk_create_counted([
+            Video(video_id=video_id, name='Video', description='', subscription=self.subscription,
+                  playlist_index=0, publish_date=timezone.now(), thumbnail='')
+            for video_id in ('video1', 'video9')
+        ])
+        self.assertCounters(5, 5, 0, 0)
@@ -1,15 +1,17 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
 
 from YtManagerApp import tasks
+from YtManagerApp.management import sync_scheduler
+from YtManagerApp.management.videos import mark_videos_watched
 from YtManagerApp.models import Video, Subscription
 
 
 class SyncNowView(View):
     def get(self, request):
-        tasks.synchronize_all.delay()
+        tasks.synchronize_all.delay(force=True)
         return JsonResponse({
             'success': True
         })
@@ -18,11 +20,11 @@ class SyncNowView(View):
     def post(self, *args, **kwargs):
         if 'subscription_pk' in kwargs:
             subscription = Subscription.objects.get(id=kwargs['subscription_pk'])
-            subscription.get_provider().synchronise_channel(subscription)
+            sync_scheduler.request_sync([subscription], debounce=False)
         elif 'folder_pk' in kwargs:
             tasks.synchronize_folder.delay(kwargs['folder_pk'])
         else:
-            tasks.synchronize_all.delay()
+            tasks.synchronize_all.delay(force=True)
         return JsonResponse({
             'success': True
         })
@@ -48,12 +50,12 @@ class DownloadVideoFilesView(LoginRequiredMixin, View):
 
 class MarkVideoWatchedView(LoginRequiredMixin, View):
     def post(self, *args, **kwargs):
-        videos = Video.objects.filter(id__in=kwargs['pk'].split(","))
-        videos.update(watched=True)
+        try:
+            video_ids = [int(pk) for pk in kwargs['pk'].split(",") if pk]
+        except ValueError:
+            return HttpResponseBadRequest()
 
-        for video in videos:
-            video.mark_watched()
-            video.save()
+        mark_videos_watched(self.request.user, video_ids, True)
 
         return JsonResponse({
             'success': True
@@ -62,9 +64,7 @@ class MarkVideoWatchedView(LoginRequiredMixin, View):
 
 class MarkVideoUnwatchedView(LoginRequiredMixin, View):
     def post(self, *args, **kwargs):
-        video = Video.objects.get(id=kwargs['pk'])
-        video.mark_unwatched()
-        video.save()
+        mark_videos_watched(self.request.user, [kwargs['pk']], False)
         return JsonResponse({
             'success': True
         })
@@ -2,8 +2,6 @@ import datetime
 import importlib
 import json
 import logging
-from math import log, floor
-from typing import List
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, HTML
@@ -11,19 +9,20 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.http import HttpRequest, HttpResponseBadRequest, JsonResponse, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.http import urlencode
 from django.views.generic import CreateView, UpdateView, DeleteView, FormView
 from django.views.generic.edit import FormMixin
 
 from YtManagerApp.IProvider import IProvider
+from YtManagerApp.management import thumbnails, result_cache
 from YtManagerApp.management.appconfig import appconfig
-from YtManagerApp.management.videos import get_videos
-from YtManagerApp.models import Subscription, SubscriptionFolder, Video, VIDEO_ORDER_CHOICES, VIDEO_ORDER_MAPPING
+from YtManagerApp.management.videos import get_videos, get_videos_page, get_videos_totals, get_shuffle_playlist
+from YtManagerApp.models import Subscription, SubscriptionFolder, VIDEO_ORDER_CHOICES, VIDEO_ORDER_MAPPING
 from YtManagerApp.utils import subscription_file_parser
 from YtManagerApp.views.controls.modal import ModalMixin
 
@@ -54,8 +53,12 @@ class VideoFilterForm(forms.Form):
         (200, 200)
     )
 
+    CHOICES_SORT = VIDEO_ORDER_CHOICES + [
+        ('relevance', 'Relevance')
+    ]
+
     query = forms.CharField(label='', required=False)
-    sort = forms.ChoiceField(label='Sort:', choices=VIDEO_ORDER_CHOICES, initial='oldest')
+    sort = forms.ChoiceField(label='Sort:', choices=CHOICES_SORT, initial='oldest')
     show_watched = forms.ChoiceField(label='Show only: ', choices=CHOICES_SHOW_WATCHED, initial='n')
     show_downloaded = forms.ChoiceField(label='', choices=CHOICES_SHOW_DOWNLOADED, initial='all')
     subscription_id = forms.IntegerField(
@@ -66,7 +69,7 @@ class VideoFilterForm(forms.Form):
         required=False,
         widget=forms.HiddenInput()
     )
-    page = forms.IntegerField(
+    cursor = forms.CharField(
         required=False,
         widget=forms.HiddenInput()
     )
@@ -89,13 +92,14 @@ class VideoFilterForm(forms.Form):
             'show_downloaded',
             'subscription_id',
             'folder_id',
-            'page',
+            'cursor',
             'results_per_page'
         )
 
     def clean_sort(self):
         data = self.cleaned_data['sort']
-        return VIDEO_ORDER_MAPPING[data]
+        # relevance is only defined for searches, get_videos sorts by it when no order is given
+        return VIDEO_ORDER_MAPPING.get(data)
 
     def clean_show_downloaded(self):
         data = self.cleaned_data['show_downloaded']
@@ -136,78 +140,99 @@ def index(request: HttpRequest):
         return render(request, 'YtManagerApp/index_unauthenticated.html', context)
 
 
-@login_required
-def ajax_get_tree(request: HttpRequest):
-    def human_format(number):
-        units = ['', 'K', 'M', 'G', 'T', 'P']
-        k = 1000.0
-        magnitude = int(floor(log(number, k)))
-        if magnitude > 0:
-            return '{0:.2}{1:s}'.format(number / k**magnitude, units[magnitude])
-        else:
-            return '{0}'.format(number)
+def __build_tree(user):
+    nodes = SubscriptionFolder.traverse(None, user, lambda node: node)
+
+    # Unwatched counts are read from the subscriptions' counters, and summed up the folder hierarchy in memory
+    sub_counts = {node.id: node.unwatched_count for node in nodes if isinstance(node, Subscription)}
+
+    folder_parents = {node.id: node.parent_id for node in nodes if isinstance(node, SubscriptionFolder)}
+    folder_counts = {folder_id: 0 for folder_id in folder_parents}
+
+    for node in nodes:
+        if isinstance(node, Subscription):
+            folder_id = node.parent_folder_id
+            visited = set()
+            while folder_id is not None and folder_id not in visited:
+                visited.add(folder_id)
+                folder_counts[folder_id] += sub_counts.get(node.id, 0)
+                folder_id = folder_parents.get(folder_id)
 
     def visit(node):
         if isinstance(node, SubscriptionFolder):
-            unwatched = node.get_unwatched_count()
             return {
                 "id": __tree_folder_id(node.id),
                 "text": node.name,
                 "type": "folder",
                 "state": {"opened": True},
                 "parent": __tree_folder_id(node.parent_id),
-                "li_attr": {"data-unwatched-count": unwatched}
+                "li_attr": {"data-unwatched-count": folder_counts[node.id]}
             }
         elif isinstance(node, Subscription):
-            unwatched = node.get_unwatched_count()
             return {
                 "id": __tree_sub_id(node.id),
                 "type": "sub",
                 "text": node.name,
-                "icon": node.thumb.url if node.thumb else None,
+                "icon": thumbnails.variant_url(node.thumb),
                 "parent": __tree_folder_id(node.parent_folder_id),
-                "li_attr": {"data-unwatched-count": unwatched}
+                "li_attr": {"data-unwatched-count": sub_counts.get(node.id, 0)}
             }
 
-    result = SubscriptionFolder.traverse(None, request.user, visit)
-    return JsonResponse(result, safe=False)
+    return [visit(node) for node in nodes]
+
+
+@login_required
+def ajax_get_tree(request: HttpRequest):
+    tree = result_cache.get_or_compute(request.user.id, 'tree', {}, lambda: __build_tree(request.user))
+    return JsonResponse(tree, safe=False)
 
 
 @login_required
 def ajax_get_tree_debug(request: HttpRequest):
-    def human_format(number):
-        units = ['', 'K', 'M', 'G', 'T', 'P']
-        k = 1000.0
-        magnitude = int(floor(log(number, k)))
-        if magnitude > 0:
-            return '{0:.2}{1:s}'.format(number / k**magnitude, units[magnitude])
-        else:
-            return '{0}'.format(number)
+    return HttpResponse(json.dumps(__build_tree(request.user)))
+
+
+def __render_videos(request: HttpRequest, form: VideoFilterForm) -> str:
+    videos = get_videos(
+        user=request.user,
+        sort_order=form.cleaned_data['sort'],
+        query=form.cleaned_data['query'],
+        subscription_id=form.cleaned_data['subscription_id'],
+        folder_id=form.cleaned_data['folder_id'],
+        only_watched=form.cleaned_data['show_watched'],
+        only_downloaded=form.cleaned_data['show_downloaded']
+    )
 
-    def visit(node):
-        if isinstance(node, SubscriptionFolder):
-            unwatched = node.get_unwatched_count()
-            return {
-                "id": __tree_folder_id(node.id),
-                "text": node.name,
-                "type": "folder",
-                "state": {"opened": True},
-                "parent": __tree_folder_id(node.parent_id),
-                "li_attr": {"data-unwatched-count": unwatched}
-            }
-        elif isinstance(node, Subscription):
-            unwatched = node.get_unwatched_count()
-            return {
-                "id": __tree_sub_id(node.id),
-                "type": "sub",
-                "text": node.name,
-                "icon": node.thumb.url if node.thumb else None,
-                "parent": __tree_folder_id(node.parent_folder_id),
-                "li_attr": {"data-unwatched-count": unwatched}
-            }
+    page, next_cursor = get_videos_page(videos, form.cleaned_data['sort'],
+                                        int(form.cleaned_data['results_per_page']),
+                                        form.cleaned_data['cursor'])
 
-    result = SubscriptionFolder.traverse(None, request.user, visit)
-    return HttpResponse(json.dumps(result))
+    # Following pages are appended to the list, so only the videos are rendered for them
+    if form.cleaned_data['cursor']:
+        return render_to_string('YtManagerApp/index_videos_page.html', {
+            'videos': page,
+            'next_cursor': next_cursor
+        }, request)
+
+    total_count, duration_raw = get_videos_totals(request.user, videos)
+    duration = str(datetime.timedelta(seconds=duration_raw))
+
+    if "folder_id" in form.cleaned_data and form.cleaned_data["folder_id"] != "" and form.cleaned_data["folder_id"] is not None:
+        shuffle_url = reverse("ajax_get_video_shuffle_folder", args=[form.cleaned_data["folder_id"]])
+    elif "subscription_id" in form.cleaned_data and form.cleaned_data["subscription_id"] != "" and form.cleaned_data["subscription_id"] is not None:
+        shuffle_url = reverse("ajax_get_video_shuffle_subscription", args=[form.cleaned_data["subscription_id"]])
+    else:
+        shuffle_url = reverse("ajax_get_video_shuffle")
+
+    context = {
+        'videos': page,
+        'next_cursor': next_cursor,
+        'total_count': total_count,
+        'duration': duration,
+        "shuffle_url": shuffle_url
+    }
+
+    return render_to_string('YtManagerApp/index_videos.html', context, request)
 
 
 @login_required
@@ -217,71 +242,23 @@ def ajax_get_videos(request: HttpRequest):
     else:
         form = VideoFilterForm(request.GET)
     if form.is_valid():
-        videos = get_videos(
-            user=request.user,
-            sort_order=form.cleaned_data['sort'],
-            query=form.cleaned_data['query'],
-            subscription_id=form.cleaned_data['subscription_id'],
-            folder_id=form.cleaned_data['folder_id'],
-            only_watched=form.cleaned_data['show_watched'],
-            only_downloaded=form.cleaned_data['show_downloaded']
-        )
-
-        duration_raw = videos.aggregate(Sum('duration'))['duration__sum'] or 0
-        duration = str(datetime.timedelta(seconds=duration_raw))
-
-        paginator = Paginator(videos, form.cleaned_data['results_per_page'])
-        videos = paginator.get_page(form.cleaned_data['page'])
-
-        if "folder_id" in form.cleaned_data and form.cleaned_data["folder_id"] != "" and form.cleaned_data["folder_id"] is not None:
-            shuffle_url = reverse("ajax_get_video_shuffle_folder", args=[form.cleaned_data["folder_id"]])
-        elif "subscription_id" in form.cleaned_data and form.cleaned_data["subscription_id"] != "" and form.cleaned_data["subscription_id"] is not None:
-            shuffle_url = reverse("ajax_get_video_shuffle_subscription", args=[form.cleaned_data["subscription_id"]])
-        else:
-            shuffle_url = reverse("ajax_get_video_shuffle")
-
-        context = {
-            'videos': videos,
-            'duration': duration,
-            "shuffle_url": shuffle_url
-        }
+        try:
+            content = result_cache.get_or_compute(request.user.id, 'videos', form.cleaned_data,
+                                                  lambda: __render_videos(request, form))
+        except ValueError:
+            # invalid cursor
+            return HttpResponseBadRequest()
 
-        return render(request, 'YtManagerApp/index_videos.html', context)
+        return HttpResponse(content)
 
     return HttpResponseBadRequest()
 
 
 @login_required
 def ajax_get_video_shuffle(request: HttpRequest, subscription_pk=None, folder_pk=None):
-    time_remaining = 60*60  # Target length, 1 hour
-
-    videos: List[Video] = []
-
-    if folder_pk is not None:
-        subscriptions = Subscription.objects.filter(parent_folder_id=folder_pk).order_by("?")
-    elif subscription_pk is not None:
-        subscriptions = [Subscription.objects.get(pk=subscription_pk)]
-    else:
-        subscriptions = Subscription.objects.all().order_by("?")
-
-    videos.append(Video.objects.filter(watched=False, subscription__in=subscriptions).order_by('publish_date').first())
-    time_remaining -= videos[0].duration
-
-    idle_loops = 0
-
-    while idle_loops <= 2:
-        added_video = False
-        for subscription in subscriptions:
-            video = subscription.video_set.filter(watched=False)\
-                .exclude(pk__in=[video.pk for video in videos]) \
-                .order_by('publish_date')\
-                .first()
-            if video and video.duration <= time_remaining:
-                time_remaining -= video.duration
-                videos.append(video)
-                added_video = True
-        if not added_video:
-            idle_loops += 1
+    videos = get_shuffle_playlist(request.user, subscription_id=subscription_pk, folder_id=folder_pk)
+    if len(videos) == 0:
+        return HttpResponseRedirect(reverse('home'))
 
     url = reverse('video', args=[videos.pop(0).pk])
     params = urlencode({"next": ",".join([str(video.id) for video in videos])})
@@ -9,39 +9,44 @@ import django_celery_results
 
 @login_required
 def ajax_get_running_jobs(request: HttpRequest):
-    sync_all_tasks = django_celery_results.models.TaskResult.objects.filter(
-        task_name="YtManagerApp.tasks.synchronize_all",
-        date_created__gte=datetime.datetime.now()-datetime.timedelta(days=1))
-
     all_children = []
     response = []
 
-    for taskResult in sync_all_tasks:
-        all_children += [taskResult.task_id]
-        task = AsyncResult(taskResult.task_id)
-
-        complete_tasks = 0
-        all_tasks = 0
-
-        for child in task.children:
-            if child.task_id not in all_children:
-                all_children += [child.task_id]
-
-            if child.successful():
-                complete_tasks += 1
-            all_tasks += 1
-
-        if all_tasks - complete_tasks == 0:
-            continue
-
-        progress = float(complete_tasks) / all_tasks
-
-        response += [{
-            'id': task.task_id,
-            'description': "Synchronize All",
-            'progress': progress,
-            'message': str(complete_tasks) + " / " + str(all_tasks)
-        }]
+    # Synchronizations go through the sync scheduler's queue, and then through the providers' tasks, so their
+    # progress is counted over all the descendant tasks
+    for task_name, description in (("YtManagerApp.tasks.synchronize_all", "Synchronize All"),
+                                   ("YtManagerApp.tasks.run_queued_syncs", "Synchronize Subscriptions")):
+        sync_tasks = django_celery_results.models.TaskResult.objects \
+            .filter(task_name=task_name,
+                    date_created__gte=datetime.datetime.now()-datetime.timedelta(days=1)) \
+            .exclude(task_id__in=all_children)
+
+        for taskResult in sync_tasks:
+            all_children += [taskResult.task_id]
+            task = AsyncResult(taskResult.task_id)
+
+            complete_tasks = 0
+            all_tasks = 0
+
+            for child in list(flatten(get_all_children(task)))[1:]:
+                if child.task_id not in all_children:
+                    all_children += [child.task_id]
+
+                if child.successful():
+                    complete_tasks += 1
+                all_tasks += 1
+
+            if all_tasks - complete_tasks == 0:
+                continue
+
+            progress = float(complete_tasks) / all_tasks
+
+            response += [{
+                'id': task.task_id,
+                'description': description,
+                'progress': progress,
+                'message': str(complete_tasks) + " / " + str(all_tasks)
+            }]
 
     sync_other_tasks = django_celery_results.models.TaskResult.objects \
         .filter(date_done__isnull=True) \
@@ -4,6 +4,7 @@ from django.urls import reverse_lazy
 from django.views.generic import FormView
 
 from YtManagerApp import tasks
+from YtManagerApp.management import result_cache, sync_scheduler, api_quota
 
 from YtManagerApp.views.forms.settings import SettingsForm, AdminSettingsForm
 
@@ -36,7 +37,12 @@ class AdminSettingsView(LoginRequiredMixin, FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # TODO: present stats
+        context['cache_stats'] = result_cache.get_stats()
+        context['suppressed_syncs'] = sync_scheduler.get_suppressed_count()
+        context['youtube_quota_used'] = api_quota.get_used('Youtube')
+        context['youtube_quota_budget'] = api_quota.get_budget('Youtube')
+        context['quota_by_endpoint'] = api_quota.get_usage_by_endpoint()
+        context['quota_by_subscription'] = api_quota.get_usage_by_subscription()
         return context
 
     def get_initial(self):
@@ -46,5 +52,5 @@ class AdminSettingsView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         form.save()
-        tasks.synchronize_all.delay()
+        tasks.synchronize_all.delay(force=True)
         return super().form_valid(form)
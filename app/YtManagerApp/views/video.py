@@ -1,19 +1,33 @@
 import datetime
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Sum
-from django.http import HttpRequest, FileResponse
+from django.http import HttpRequest, HttpResponse, FileResponse, StreamingHttpResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 from django.views.generic import DetailView
 from django.conf import settings
 
 from YtManagerApp.models import Video
 
+__RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Size of the blocks read when streaming a range of a video file
+__CHUNK_SIZE = 256 * 1024
+
 
 class VideoDetailView(LoginRequiredMixin, DetailView):
     template_name = 'YtManagerApp/video.html'
     model = Video
 
+    def get_queryset(self):
+        return Video.objects.filter(subscription__user=self.request.user)
+
     def get_template_names(self):
         return [self.object.subscription.provider+"/videoframe.html"]
 
@@ -27,15 +41,129 @@ class VideoDetailView(LoginRequiredMixin, DetailView):
             up_next_videos = self.request.GET.get('next').split(',')
             context['up_next_count'] = len(up_next_videos)
             context['up_next_duration'] = str(
-                datetime.timedelta(seconds=Video.objects.filter(id__in=up_next_videos).aggregate(Sum('duration'))['duration__sum']))
+                datetime.timedelta(seconds=self.get_queryset().filter(id__in=up_next_videos).aggregate(Sum('duration'))['duration__sum']))
 
         return context
 
 
 @login_required
 def video_detail_view(request: HttpRequest, pk):
-    video = Video.objects.get(id=pk)
-    video_file, _ = video.find_video()
+    """
+    Serves a downloaded video file. Byte ranges are supported so that players can seek, and the file is handed off
+    to the front web server when VIDEO_SERVE_MODE asks for it, so that Django doesn't stream the data itself.
+    """
+    video = get_object_or_404(Video, id=pk, subscription__user=request.user)
+    video_file, mime = video.find_video()
+    if video_file is None:
+        raise Http404('The video was not downloaded.')
+
+    try:
+        stat = os.stat(video_file)
+    except FileNotFoundError:
+        raise Http404('The video file does not exist.')
+
+    # The front web server handles ranges and conditional requests of the files it serves
+    response = __hand_off(video_file, mime)
+    if response is not None:
+        return response
+
+    etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = __stream(request, video_file, mime, stat.st_size, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def __hand_off(video_file: str, mime: str) -> Optional[HttpResponse]:
+    if settings.VIDEO_SERVE_MODE == 'sendfile':
+        response = HttpResponse(content_type=mime)
+        response['X-Sendfile'] = os.path.abspath(video_file)
+        return response
+
+    if settings.VIDEO_SERVE_MODE == 'nginx':
+        root = os.path.abspath(settings.VIDEO_ACCEL_REDIRECT_ROOT)
+        path = os.path.abspath(video_file)
+        if os.path.commonpath([root, path]) == root:
+            response = HttpResponse(content_type=mime)
+            response['X-Accel-Redirect'] = settings.VIDEO_ACCEL_REDIRECT_LOCATION.rstrip('/') + '/' \
+                + quote(os.path.relpath(path, root).replace(os.sep, '/'))
+            return response
+
+    return None
+
+
+def __stream(request: HttpRequest, video_file: str, mime: str, size: int, etag: str, last_modified: int):
+    byte_range = None
+    if __if_range_passes(request, etag, last_modified):
+        byte_range = __parse_range(request.META.get('HTTP_RANGE', ''), size)
+
+    if byte_range is None:
+        return FileResponse(open(video_file, 'rb'), content_type=mime)
+
+    start, end = byte_range
+    if start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
 
     f = open(video_file, 'rb')
-    return FileResponse(f)
+    f.seek(start)
+    response = StreamingHttpResponse(__read_range(f, end - start + 1), status=206, content_type=mime)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def __if_range_passes(request: HttpRequest, etag: str, last_modified: int) -> bool:
+    # A range applies to the file the client already has a part of; if the file changed, all of it is sent instead
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def __parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single range of a Range header. Malformed headers and multiple ranges are ignored, and the whole file
+    is sent instead.
+    :return: First and last byte of the range, the first being past the end of the file if the range can't be
+             satisfied, or None to send the whole file
+    """
+    match = __RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        return start, end
+
+    if last:
+        # Suffix range: the last bytes of the file
+        length = int(last)
+        if length == 0:
+            return size, size
+        return max(size - length, 0), size - 1
+
+    return None
+
+
+def __read_range(f, length: int):
+    with f:
+        while length > 0:
+            chunk = f.read(min(__CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
@@ -84,6 +84,10 @@ class YouTube(object):
         # build_kwargs now contains credentials, or a developer key
         self.build = googleapiclient.discovery.build(**build_kwargs)
 
+        # functions called as hook(query, api_params) before each query is sent to the api, e.g. to account for
+        #  quota usage.  a hook may raise an exception to prevent the query from being sent.
+        self.query_hooks = []
+
     def __repr__(self):
         return "<YouTube object>"
 
@@ -413,6 +417,9 @@ class Query(object):
         else:
             query_params = self.api_params
 
+        for hook in self.youtube.query_hooks:
+            hook(self, query_params)
+
         log.debug(f"executing query with {str(query_params)}")
         return self.query_func(**query_params).execute()
 